@@ -18,11 +18,10 @@ def get_analysis(script_name, hidden_imports=None):
             'fitz',
             'pytesseract',
             'openpyxl',
-            'pandas',
             'pydantic',
             'loguru',
             'requests',
-            'tomli',
+            'orjson',
             'packaging' # CTk dep
         ] + hidden_imports,
         hookspath=[],
@@ -9,6 +9,7 @@ Usage:
     or
     venv\Scripts\python.exe run.py
 """
+import multiprocessing
 import sys
 from pathlib import Path
 
@@ -84,6 +85,7 @@ def main(page: ft.Page):
     orchestrator = ProcessingOrchestrator(
         extractor=extractor,
         max_workers=settings.processing.max_concurrent_files,
+        use_processes=settings.processing.use_processes,
     )
     
     excel_reporter = ExcelReporter(output_dir=output_dir)
@@ -101,6 +103,8 @@ def main(page: ft.Page):
 
 
 if __name__ == "__main__":
+    # Necessário para o pool de processos (spawn) no executável PyInstaller
+    multiprocessing.freeze_support()
     try:
         print("=" * 60)
         print("Fiscal Document Extractor")
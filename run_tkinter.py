@@ -1,6 +1,7 @@
 """
 Fiscal Document Extractor - CustomTkinter Launcher
 """
+import multiprocessing
 import sys
 from pathlib import Path
 import tempfile
@@ -104,6 +105,7 @@ def main():
     orchestrator = ProcessingOrchestrator(
         extractor=extractor,
         max_workers=settings.processing.max_concurrent_files,
+        use_processes=settings.processing.use_processes,
     )
     
     excel_reporter = ExcelReporter(output_dir=output_dir)
@@ -119,4 +121,6 @@ def main():
     app.mainloop()
 
 if __name__ == "__main__":
+    # Necessário para o pool de processos (spawn) no executável PyInstaller
+    multiprocessing.freeze_support()
     main()
@@ -31,7 +31,8 @@ class HybridExtractor:
                  pdf_page_limit: int = 0,
                  llm_enabled: bool = False,
                  llm_model: str = "llama3:8b",
-                 llm_url: str = "http://localhost:11434"):
+                 llm_url: str = "http://localhost:11434",
+                 vision_lock=None):
         """
         Initialize hybrid extractor.
         
@@ -45,7 +46,16 @@ class HybridExtractor:
             llm_enabled: Whether to enable LLM extraction
             llm_model: Ollama model name
             llm_url: Ollama API URL
+            vision_lock: Lock serializing Vision calls; pass one shared lock when several
+                         extractors (e.g. process-pool workers) talk to the same Ollama
         """
+        # Argumentos originais: permitem recriar o extractor em processos filhos (orchestrator use_processes)
+        self.init_kwargs = dict(
+            cnpj_mapper=cnpj_mapper, min_text_length=min_text_length, tesseract_cmd=tesseract_cmd,
+            ocr_language=ocr_language, ocr_dpi=ocr_dpi, pdf_page_limit=pdf_page_limit,
+            llm_enabled=llm_enabled, llm_model=llm_model, llm_url=llm_url
+        )
+        
         self.cnpj_mapper = cnpj_mapper
         self.pdf_page_limit = pdf_page_limit
         self.llm_enabled = llm_enabled
@@ -66,7 +76,7 @@ class HybridExtractor:
                 logger.info(f"Initializing Vision Extractor with model: {llm_model}")
                 self.vision_extractor = VisionExtractor(model_name=llm_model, base_url=llm_url)
                 self.llm_extractor = None
-                self._vision_lock = threading.Lock() # Serialize Vision access
+                self._vision_lock = vision_lock if vision_lock is not None else threading.Lock() # Serialize Vision access
             else:
                 from core.extractor_llm import LLMExtractor
                 logger.info(f"Initializing Text LLM Extractor with model: {llm_model}")
@@ -77,6 +87,13 @@ class HybridExtractor:
             self.llm_extractor = None
             self.vision_extractor = None
     
+    def worker_kwargs(self) -> dict:
+        """
+        Arguments to rebuild this extractor in a worker process, reflecting its current
+        state (llm_enabled can be toggled by the UI after construction).
+        """
+        return dict(self.init_kwargs, llm_enabled=self.llm_enabled)
+    
     def extract(self, pdf_bytes: bytes, filename: str, check_cancel: Optional[Callable[[], bool]] = None) -> Tuple[FiscalDocument, float]:
         """
         Extract fiscal document data using the appropriate method.
@@ -90,15 +107,10 @@ class HybridExtractor:
         
         # Detect PDF type
         is_text_based = self.text_extractor.is_text_based(pdf_bytes)
-        full_text_content = "" # Store text for LLM if needed
-        
         try:
             if is_text_based:
                 logger.info(f"{filename} is text-based, using direct extraction")
                 doc = self.text_extractor.extract(pdf_bytes, filename, check_cancel=check_cancel)
-                # Capture text for potential LLM fallback
-                with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-                     full_text_content = "\n".join([p.extract_text() or "" for p in pdf.pages])
             else:
                 logger.info(f"{filename} is scanned, using OCR extraction")
                 # OCR Extractor modified to return text ideally, or we capture it from doc metadata if we stored it
@@ -121,6 +133,15 @@ class HybridExtractor:
                 
                 if self.vision_extractor:
                     # Vision Fallback (Preferred for LLaVA/Moondream)
+                    # Renderizar as páginas FORA do lock: a rasterização (CPU) deste documento
+                    # sobrepõe a inferência do documento que está usando o Ollama
+                    # (resultado já em cache: extract() responde sem precisar das imagens).
+                    # Uma única consulta ao cache (hash + leitura), repassada ao extract()
+                    cache_key, cached = self.vision_extractor.lookup_cache(pdf_bytes)
+                    images_b64 = None
+                    if cached is None:
+                        images_b64 = self.vision_extractor.render_images(pdf_bytes)
+                    
                     # Use lock to prevent concurrent Ollama calls (Timeout prevention)
                     # Acquire lock but check for cancellation inside waiting if possible? 
                     # Simpler: Acquire lock, THEN check cancel immediately.
@@ -130,12 +151,17 @@ class HybridExtractor:
                             return doc, (datetime.now() - start_time).total_seconds()
                             
                         logger.info(f"Using Vision Extractor ({self.vision_extractor.model_name})...")
-                        vision_doc = self.vision_extractor.extract(pdf_bytes, filename, check_cancel)
+                        vision_doc = self.vision_extractor.extract(pdf_bytes, filename, check_cancel,
+                                                                   images_b64=images_b64,
+                                                                   cache_key=cache_key, cached=cached)
                         self._merge_docs(doc, vision_doc)
                     
                 elif self.llm_extractor:
                     # Text LLM Fallback (Legacy/Text-only models)
-                    if full_text_content or is_text_based:
+                    if is_text_based:
+                         # Texto lido só aqui: reabrir o PDF e extrair todas as páginas de novo
+                         # custava caro em todo documento, mesmo sem LLM habilitado
+                         full_text_content = self._read_full_text(pdf_bytes)
                          llm_doc = self.llm_extractor.extract(full_text_content, filename)
                          self._merge_docs(doc, llm_doc)
                     else:
@@ -169,6 +195,12 @@ class HybridExtractor:
         
         return doc, processing_time
     
+    @staticmethod
+    def _read_full_text(pdf_bytes: bytes) -> str:
+        """Full text of a text-based PDF (input for the text LLM fallback)."""
+        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+            return "\n".join([p.extract_text() or "" for p in pdf.pages])
+    
     def _is_extraction_poor(self, doc: FiscalDocument) -> bool:
         """Check if regex extraction missed critical fields"""
         # Critical fields missing
@@ -197,7 +229,7 @@ class HybridExtractor:
                 target.valores.cofins = source.valores.cofins
                 target.valores.inss = source.valores.inss
                 target.valores.ir = source.valores.ir
-                target.valores.csll = source.valores.csll
+                target.valores.csll_retida = source.valores.csll_retida
                 target.valores.valor_liquido = source.valores.valor_liquido
 
         if not target.itens and source.itens:
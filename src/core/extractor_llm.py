@@ -1,26 +1,50 @@
 """
 LLM-based extraction using local Ollama instance.
 """
-import json
+import orjson
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Optional, Dict, Any
 from datetime import datetime
 from loguru import logger
 
 from models import FiscalDocument, ProcessingStatus, DocumentType, Entity, Address, TaxValues, ServiceItem
+from core.extractor_text import parse_monetary_value
+
+
+# ServiceItem é um dataclass sem validação: o que o LLM devolve iria direto para a planilha
+def _to_float(value: Any) -> Optional[float]:
+    """Numeric field from the LLM JSON: numbers pass, BR-formatted strings are parsed, else None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return parse_monetary_value(value)
+    return None
+
 
 class LLMExtractor:
     """Extracts fiscal data using a local LLM via Ollama"""
     
-    def __init__(self, model_name: str = "llama3:8b", base_url: str = "http://localhost:11434"):
+    def __init__(self, model_name: str = "llama3:8b", base_url: str = "http://localhost:11434",
+                 max_concurrent: int = 2, timeout: int = 120):
         self.model_name = model_name
         self.base_url = base_url
         self.api_url = f"{base_url}/api/generate"
+        self.timeout = timeout
+        
+        # O Ollama processa uma geração por vez na GPU: mais de 1-2 requisições simultâneas
+        # só enfileiram no servidor (e estouram timeout). As demais threads aguardam aqui.
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent, max_retries=0))
         
     def is_available(self) -> bool:
         """Check if Ollama is running and model is available"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags")
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=5)
             if response.status_code == 200:
                 models = [m['name'] for m in response.json().get('models', [])]
                 # Check for partial match (e.g. "llama3:8b" in "llama3:8b-instruct")
@@ -40,18 +64,19 @@ class LLMExtractor:
             
             prompt = self._build_prompt(text_content)
             
-            response = requests.post(self.api_url, json={
-                "model": self.model_name,
-                "prompt": prompt,
-                "stream": False,
-                "format": "json" # Force JSON mode
-            })
+            with self._slots:
+                response = self.session.post(self.api_url, data=orjson.dumps({
+                    "model": self.model_name,
+                    "prompt": prompt,
+                    "stream": False,
+                    "format": "json" # Force JSON mode
+                }), headers={"Content-Type": "application/json"}, timeout=self.timeout)
             
             if response.status_code != 200:
                 raise Exception(f"Ollama API error: {response.text}")
                 
-            result = response.json()
-            extracted_json = json.loads(result['response'])
+            result = orjson.loads(response.content)
+            extracted_json = orjson.loads(result['response'])
             
             # Map JSON to FiscalDocument
             self._map_json_to_doc(extracted_json, doc)
@@ -128,9 +153,10 @@ class LLMExtractor:
         elif data.get("tipo_documento") == "NF-e":
             doc.document_type = DocumentType.NFE
             
-        doc.numero = str(data.get("numero") or "")
-        doc.serie = data.get("serie")
-        doc.chave_acesso = data.get("chave_acesso")
+        # Sem validate_assignment: o JSON pode trazer números, normalizar para str aqui
+        doc.numero = str(data.get("numero") or "") or None
+        doc.serie = str(data.get("serie") or "") or None
+        doc.chave_acesso = FiscalDocument.validate_chave_acesso(data.get("chave_acesso"))
         
         # Datas
         if data.get("data_emissao"):
@@ -173,7 +199,7 @@ class LLMExtractor:
                 cofins=vals.get("cofins"),
                 inss=vals.get("inss"),
                 ir=vals.get("ir"),
-                csll=vals.get("csll"),
+                csll_retida=vals.get("csll"),  # TaxValues não tem "csll"
                 valor_liquido=vals.get("valor_liquido")
             )
 
@@ -182,7 +208,7 @@ class LLMExtractor:
         for item in items:
             doc.itens.append(ServiceItem(
                 descricao=str(item.get("descricao", "")),
-                quantidade=item.get("quantidade"),
-                valor_unitario=item.get("valor_unitario"),
-                valor_total=item.get("valor_total")
+                quantidade=_to_float(item.get("quantidade")),
+                valor_unitario=_to_float(item.get("valor_unitario")),
+                valor_total=_to_float(item.get("valor_total"))
             ))
@@ -1,11 +1,238 @@
 import io
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
 from typing import Optional, Dict, Any, List, Tuple
 import re
+import threading
 from datetime import datetime
 import pdfplumber
 from loguru import logger
-from models import FiscalDocument, Entity, Address, TaxValues, ServiceItem, DocumentType
+from models import FiscalDocument, Entity, Address, TaxValues, ServiceItem, DocumentType, digits_only
 from core.ollama_service import extract_with_ollama, is_ollama_available
+
+# ==================== PRECOMPILED PATTERNS ====================
+# Compilados uma única vez no import (evita lookup no cache do `re` a cada NF)
+
+# Limpeza de nomes / CNPJs
+_NAME_LEAD_RE = re.compile(r'^[\d\.\-/]+')
+_NAME_CAMEL_RE = re.compile(r'([A-Z])([A-Z][a-z])')
+_NAME_LABEL_RE = re.compile(r'^.*?(?:Raz[ãa]o|Social|Nome|Razao)\s+(?:Social\s+)?', re.IGNORECASE)
+_NAME_SUFFIX_SA_RE = re.compile(r'([A-ZÀ-Ú])(S\.A\.|S\.A|SA|S/A)$', re.IGNORECASE)
+_NAME_SUFFIX_LTDA_RE = re.compile(r'([A-ZÀ-Ú])(LTDA|ME|EPP|EIRELI)$', re.IGNORECASE)
+
+# Emitente
+# [FIX] NFS-e Guarulhos: padrão "Prestador do Serviço NOME" (nome na mesma linha do label)
+_PRESTADOR_INLINE_RE = re.compile(r'Prestador\s+do\s+Servi[çc]o\s+([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.&\-]{3,30}?)(?:\n|$)', re.IGNORECASE)
+_SECTION_LABEL_LINE_RE = re.compile(r'^(?:Nome|Razão|Raz[ãa]o|CPF|CNPJ|Inscrição|Endereço)', re.IGNORECASE)
+_COMPANY_SUFFIX_WORD_RE = re.compile(r'(?:LTDA|S\.?A\.?|ME|EPP|EIRELI|S/A)\b', re.IGNORECASE)
+_TRAILING_PIPE_RE = re.compile(r'\s*[|]\s*.*$')
+_STARTS_WITH_LETTER_RE = re.compile(r'^[A-ZÀ-Ú]')
+# [FIX] Guarulhos: razão social que parece bairro/localidade
+_LOCATION_KEYWORD_RE = re.compile(r'CIDADE|BAIRRO|CENTRO|VILA|JARDIM|PARQUE', re.IGNORECASE)
+
+# Padrões de CNPJ só capturam dígitos/pontuação: rodam case-sensitive sobre text_upper
+# (sem IGNORECASE o sre consegue usar a busca rápida pelo prefixo literal)
+_EMITENTE_CNPJ_PATTERNS = [
+    re.compile(r'CPF/CNPJ[:\s]*+([\d\.\/-]+)'),
+    re.compile(r'CNPJ/CPF[:\s]*+([\d\.\/-]+)'),
+    re.compile(r'CNPJ[:\s]*+([\d\.\/-]+)'),
+    re.compile(r'(?:CNPJ\s+(?:DO\s+)?(?:EMITENTE|PRESTADOR))[:\s]*+([\d\.\/-]+)'),
+    re.compile(r'(?:PRESTADOR|EMITENTE)[:\s]*+CNPJ[:\s]*+([\d\.\/-]+)'),
+]
+
+_EMITENTE_NAME_PATTERNS = [
+    # [FIX] NFS-e ADL: nome antes de "Nº:" ou variações OCR (N5:, No:, N0:) na mesma linha
+    # Texto OCR DPI 400: "A DE L SIQUEIRA ME Nº: 7354"
+    # Texto OCR DPI 200: "+ 4 DE L SIQUEIRA ME N5: 7354" (começa corrompido)
+    r'(?:\n|^).{0,3}([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.&\-]{5,50}?)\s*N[º°5oO0]:\s*\d+',
+
+    # [FIX] NFS-e Guarulhos RENOSUL: nome na MESMA LINHA após "Prestador do Serviço"
+    # Texto OCR: "Prestador do Serviço RENOSUL\n" - nome direto após label até quebra de linha
+    r'Prestador\s+do\s+Servi[çc]o\s+([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.&\-]{3,30}?)(?:\n|$)',
+
+    # Padrão NFS-e SP: linha após "Nome/NomeEmpresarial" contém "CNPJ_parcialNOME"
+    # Ex: "35.600.304FABIOLUIZSANTOSSILVA"
+    r'Nome/?NomeEmpresarial[^\n]*+\n[\d\.\-/]++([A-Z]{2,}+)\s',
+
+    # Padrão alternativo: CNPJ.NNN seguido de nome em maiúsculas
+    r'\d{2}\.\d{3}\.\d{3}([A-Z]{2,}+)\s',
+
+    # Padrão NFS-e SP: "Nome / Nome Empresarial: CNPJ NOME"
+    r'Nome\s*/?\.?\s*Nome\s+Empresarial[:\s]*+[\d\.\-/]++\s*+([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]+)',
+
+    # Padrão: linha seguinte após "EMITENTE DA NFS-e" ou "Prestador do Serviço"
+    r'(?:EMITENTE|PRESTADOR)[^\n]*+\n[^\n]*+\n\s*+([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]{5,})',
+
+    r'Nome\s*/\s*Nome\s+Empresarial[:\s]*([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\.\&\-]+)',
+    r'(?:Raz[ãa]o\s+Social|Nome\s+(?:do\s+)?(?:Emitente|Prestador))[:\s]*([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\.\&\-]+)',
+    r'(?:Prestador|Emitente)[:\s]*(?:Raz[ãa]o\s+Social)?[:\s]*([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]{5,})',
+]
+_EMITENTE_NAME_PATTERNS = [re.compile(p, re.IGNORECASE) for p in _EMITENTE_NAME_PATTERNS]
+
+# Destinatário
+_DESTINATARIO_CNPJ_PATTERNS = [
+    re.compile(r'(?:CNPJ\s+(?:DO\s+)?(?:DESTINAT[ÁA]RIO|TOMADOR|CLIENTE))[\s:]*([D\.\/-]+)'),
+    re.compile(r'(?:DESTINAT[ÁA]RIO|TOMADOR)[:\s]*+CNPJ[:\s]*+([\d\.\/-]+)'),
+    re.compile(r'(?:CPF/CNPJ\s+(?:DO\s+)?(?:TOMADOR|CLIENTE))[:\s]*+([\d\.\/-]+)'),
+]
+_DESTINATARIO_NAME_PATTERNS = [
+    re.compile(r'(?:Raz[ãa]o\s+Social|Nome\s+(?:do\s+)?(?:Destinat[áa]rio|Tomador|Cliente))[:\s]*([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\.\&\-]+)', re.IGNORECASE),
+    re.compile(r'(?:Destinat[áa]rio|Tomador)[:\s]*(?:Raz[ãa]o)?[:\s]*([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]{5,})', re.IGNORECASE),
+]
+
+# Seção de entidade (_parse_entity_from_section)
+# Padrões de CNPJ - ordem de prioridade
+# [FIX] OCR às vezes lê ponto como vírgula e omite barra (ex: 15,572.1540001-25)
+_SECTION_CNPJ_PATTERNS = [
+    # Padrão específico com label "CNPJ" ou "CPF/CNPJ" - muito flexível para OCR
+    r'C(?:PF[/\\I])?CN?PJ?[:\s.]++(\d{2}[.,]?\d{3}[.,]?\d{3}[/\\]?\d{4}[-]?\d{2})',
+    # Padrão genérico de CNPJ formatado (com separadores)
+    r'\b(\d{2}[.,]\d{3}[.,]\d{3}[/\\]\d{4}[-]?\d{2})\b',
+    # [FIX] Padrão OCR corrompido: números colados com vírgula/ponto (15,572.1540001-25)
+    r'\b(\d{2}[.,]\d{3}[.,]?\d{3,4}\d{4}[-]?\d{2})\b',
+]
+_SECTION_CNPJ_PATTERNS = [re.compile(p, re.IGNORECASE) for p in _SECTION_CNPJ_PATTERNS]
+
+_SECTION_RAZAO_PATTERNS = [
+    # [FIX] NFS-e Barueri: Nome empresarial na 1ª linha da seção (sem label)
+    # Captura linha iniciando com maiúscula, terminando com sufixo empresarial
+    # PRIORIDADE MÁXIMA - padrão mais específico
+    r'^\s*([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]+(?:LTDA|S\.?A\.?|ME|EPP|EIRELI|S/A))\s*$',
+
+    # [FIX] Alternativo: qualquer linha com sufixo empresarial
+    r'([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]{5,}(?:LTDA|S\.?A\.?|ME|EPP|EIRELI|S/A))',
+
+    # [FIX] NFS-e Salvador: nome empresa pode estar em linha após "Nome/Razão Social:"
+    # Ex: "Nome/Razão Social: polo ir\nPITECNOLOGIA DA INFORMAÇÃO LTDA - ME"
+    r'Nome/Raz[ãa]o\s+Social:[^\n]*+\n([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]+(?:LTDA|S\.?A\.?|ME|EPP|EIRELI|S/A)[^\n]*)',
+
+    # Padrão NFS-e SP: CNPJ.parcial seguido de nome colado (ex: 35.600.304FABIOLUIZSANTOSSILVA)
+    r'\d{2}\.\d{3}\.\d{3}([A-Z]{2,}+)\s',
+
+    # [FIX] DANFSe v1.0 (Itatiba/BH): "Nome/NomeEmpresarial E-mail\nTOTVSS.A. email@..."
+    # Captura nome colado em maiúsculas após label colado
+    r'Nome/NomeEmpresarial\s+E-?mail\n([A-ZÀ-Ú][A-ZÀ-Ú0-9\.\,\-]+?)(?:\s+[A-Za-z0-9@\._-]+@|\n)',
+
+    # [FIX] OCR NFS-e SP: caracteres extras antes de "Razão Social" (ex: "HNomesRazão", "MomeiRazão")
+    # Ignora caracteres antes e captura nome após ":", "." ou espaços
+    r'(?:Nome.?)?Raz[ãa]o\s+Social[:\.\s]+([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]+)',
+
+    # Padrões genéricos - EXCLUIR "Nome Tomador" para evitar falsos positivos
+    r'Raz[ãa]o\s+Social[:\s]*([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\.\&\-]+)',
+]
+_SECTION_RAZAO_PATTERNS = [re.compile(p, re.IGNORECASE | re.MULTILINE) for p in _SECTION_RAZAO_PATTERNS]
+
+# Endereço
+_ADDRESS_LOG_PATTERNS = [
+    # [FIX] NFS-e Barueri: Endereço multi-linha começando com RUA/AVENIDA
+    # Ex: "RUA POMPEIA , 368\nCHACARAS MARCO / CRUZ PRETA\nCEP 06419-140 - BARUERI - SP"
+    r'((?:RUA|AVENIDA|AV\.?)\s+[A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\,\.\-]+?)(?=\n.*CNPJ|\n.*Inscrição|\n.*Telefone|$)',
+
+    # Padrão NFS-e SP: linha após "Endereço Município CEP" contém endereço colado
+    # Ex: "FABIODEALMEIDAMAGALHAES,120,JARDIMSANTOELIAS SãoPaulo-SP 5135370"
+    r'Endere[çc]o\s+Munic[íi]pio\s+CEP\n([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\,\s\.\-]+?)(?:\s+[A-ZÀ-Ú][a-zà-ú]+(?:Paulo|Janeiro)?-?[A-Z]{2})',
+
+    # Padrão genérico: endereço na mesma linha
+    r'(?:Endere[çc]o|Logradouro)[:\s]*([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\.\,\-]+?)(?=\s*(?:N[°ºo]|Num|,|\n|Bairro|CEP|$))',
+    r'(?:Rua|Avenida|Av\.|Travessa|Alameda)\s+([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\.\-]+?)(?=\s*(?:,|N[°º]|\n|$))',
+]
+_ADDRESS_LOG_PATTERNS = [re.compile(p, re.IGNORECASE) for p in _ADDRESS_LOG_PATTERNS]
+_ADDRESS_NUM_PATTERNS = [re.compile(r'(?:N[°ºo]|Num(?:ero)?)[:\.\s]*(\d+[A-Z]?)', re.IGNORECASE)]
+_ADDRESS_BAIRRO_PATTERNS = [re.compile(r'Bairro[:\s]*([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\.\-]+?)(?=\s*(?:Munic|Cidade|UF|CEP|\n|$))', re.IGNORECASE)]
+_ADDRESS_CITY_PATTERNS = [re.compile(r'(?:Munic[íi]pio|Cidade)[:\s]*([A-ZÀ-Ú][A-ZÀ-Ú\s\-]+?)(?=\s*(?:UF|Estado|CEP|/|\n|$))', re.IGNORECASE)]
+_ADDRESS_CEP_LABEL_RE = re.compile(r'CEP[:\s]*(\d{5}-?\d{3})', re.IGNORECASE)
+_ADDRESS_CEP_RE = re.compile(r'\b(\d{5}-\d{3})\b')
+_ADDRESS_UF_PATTERNS = [re.compile(r'(?:UF|Estado)[:\s]*([A-Z]{2})\b', re.IGNORECASE)]
+
+# Seções
+# [FIX] NFS-e Barueri: sufixo empresarial na mesma linha do label de seção
+_COMPANY_SUFFIX_RE = re.compile(r'(?:LTDA|S\.?A\.?|ME|EPP|EIRELI|S/A)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=32)
+def _label_scanner(labels: Tuple[str, ...]) -> "re.Pattern":
+    """
+    Compile a label list into a single case-insensitive scanner.
+
+    Each label gets its own group (group index = priority + 1) inside a
+    lookahead, so one finditer pass reports overlapping hits for every label.
+    """
+    alternation = '|'.join(f'({re.escape(label)})' for label in labels)
+    return re.compile(f'(?=(?:{alternation}))', re.IGNORECASE)
+
+
+# Retenções
+_MONEY_VALUE_RE = re.compile(r'R?\$?\s*([\d\.]+[,]\d{2})')
+
+
+@lru_cache(maxsize=None)
+def _retention_patterns(tax_name: str) -> Tuple[List["re.Pattern"], List["re.Pattern"]]:
+    """Compile (once per tax) the direct and proximity-label retention patterns."""
+    # Patterns specific to each tax
+    patterns = {
+        'PIS': [
+            rf'{tax_name}\s*(?:/PASEP)?\s+RETID[OA]\s*[:\s]*R?\$?\s*([\d\.,]+)',
+            rf'{tax_name}Retid[oa]\s*[:\s]*R?\$?\s*([\d\.,]+)',  # Colado
+            rf'RETEN[ÇC][ÃA]O\s+(?:DE\s+)?{tax_name}\s*[:\s]*R?\$?\s*([\d\.,]+)',
+        ],
+        'COFINS': [
+            rf'{tax_name}\s+RETID[OA]\s*[:\s]*R?\$?\s*([\d\.,]+)',
+            rf'{tax_name}Retid[oa]\s*[:\s]*R?\$?\s*([\d\.,]+)',  # Colado
+            rf'RETEN[ÇC][ÃA]O\s+(?:DE\s+)?{tax_name}\s*[:\s]*R?\$?\s*([\d\.,]+)',
+        ],
+        'CSLL': [
+            rf'{tax_name}\s+RETID[OA]\s*[:\s]*R?\$?\s*([\d\.,]+)',
+            rf'{tax_name}Retid[oa]\s*[:\s]*R?\$?\s*([\d\.,]+)',  # Colado
+            rf'RETEN[ÇC][ÃA]O\s+(?:DE\s+)?{tax_name}\s*[:\s]*R?\$?\s*([\d\.,]+)',
+        ],
+        'IRRF': [
+            rf'{tax_name}\s*[:\s]*R?\$?\s*([\d\.,]+)',
+            rf'IR\s+RETIDO\s*[:\s]*R?\$?\s*([\d\.,]+)',
+        ],
+        'INSS': [
+            rf'{tax_name}\s+RETIDO\s*[:\s]*R?\$?\s*([\d\.,]+)',
+            rf'{tax_name}Retido\s*[:\s]*R?\$?\s*([\d\.,]+)',  # Colado
+            rf'RETEN[ÇC][ÃA]O\s+(?:DE\s+)?{tax_name}\s*[:\s]*R?\$?\s*([\d\.,]+)',
+        ],
+        'ISS': [
+            rf'{tax_name}\s+RETIDO\s*[:\s]*R?\$?\s*([\d\.,]+)',
+            rf'{tax_name}\s+[Aa]\s+[Rr]ETER\s*[:\s]*R?\$?\s*([\d\.,]+)',
+            rf'RETEN[ÇC][ÃA]O\s+(?:DE\s+)?{tax_name}(?:QN)?\s*[:\s]*R?\$?\s*([\d\.,]+)',
+        ],
+    }
+    
+    # Labels para busca por proximidade
+    label_patterns = [
+        rf'{tax_name}\s*(?:/PASEP)?\s*[\(\[]?R\$[\)\]]?',  # "PIS (R$)" or "PIS [R$]"
+        rf'{tax_name}\s+RETID[OA]',
+        rf'{tax_name}Retid[oa]',  # Colado
+    ]
+    return (
+        [re.compile(p, re.IGNORECASE) for p in patterns.get(tax_name, [])],
+        [re.compile(p, re.IGNORECASE) for p in label_patterns],
+    )
+
+
+@lru_cache(maxsize=64)
+def _date_label_pattern(label: str) -> "re.Pattern":
+    """Compile '<label> dd/mm/aaaa' once per label."""
+    return re.compile(rf'{label}[:\s]*(\d{{2}})[/\-\.](\d{{2}})[/\-\.](\d{{4}})', re.IGNORECASE)
+
+
+def parse_monetary_value(value_str: str) -> Optional[float]:
+    """Parse a BR-formatted amount ('R$ 1.234,56') into float; None if not a number."""
+    if not value_str: return None
+    try:
+        clean = value_str.replace('R$', '').strip().replace(' ', '')
+        # Formato BR: vírgula decimal, ponto de milhar
+        if ',' in clean:
+            if '.' in clean:
+                clean = clean.replace('.', '')
+            clean = clean.replace(',', '.')
+        return float(clean)
+    except (AttributeError, ValueError): return None
+
+
 class TextExtractor:
     """Extracts data from text-based PDFs with robust fallbacks"""
     
@@ -13,9 +240,24 @@ class TextExtractor:
     BRAZILIAN_STATES = {'AC', 'AL', 'AP', 'AM', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 
                         'MT', 'MS', 'MG', 'PA', 'PB', 'PR', 'PE', 'PI', 'RJ', 'RN', 
                         'RS', 'RO', 'RR', 'SC', 'SP', 'SE', 'TO'}
+    # Uma única alternação em vez de um re.search por UF
+    _BR_STATE_RE = re.compile(r'\b(' + '|'.join(sorted(BRAZILIAN_STATES)) + r')\b')
+    
+    # Labels de seção (ordem = prioridade), montados uma vez por classe
+    # [FIX] Usar label completo 'PRESTADOR DE SERVIÇOS' com prioridade
+    EMITENTE_START_LABELS = ('PRESTADOR DE SERVIÇOS', 'EMITENTE', 'PRESTADOR', 'DADOS DO PRESTADOR')
+    # [FIX] Usar 'TOMADOR DE SERVIÇOS' como end_label completo
+    EMITENTE_END_LABELS = ('TOMADOR DE SERVIÇOS', 'DESTINAT', 'TOMADOR', 'DADOS DO TOMADOR', 'VALORES', 'ITENS', 'DISCRIMINAÇÃO')
+    # [FIX] Usar label completo 'TOMADOR DE SERVIÇOS' com prioridade para evitar cortar em 'SERVIÇOS'
+    DESTINATARIO_START_LABELS = ('TOMADOR DE SERVIÇOS', 'DESTINAT', 'TOMADOR', 'DADOS DO TOMADOR', 'CLIENTE')
+    # [FIX] Remover 'SERVIÇOS' para evitar cortar seção 'TOMADOR DE SERVIÇOS' prematuramente
+    DESTINATARIO_END_LABELS = ('INTERMEDIÁRIO', 'VALORES', 'ITENS', 'DISCRIMINAÇÃO', 'PRODUTOS', 'TOTAL')
     
     def __init__(self, min_text_length: int = 50):
         self.min_text_length = min_text_length
+        # Cache de palavras por página, válido durante um extract() (por thread,
+        # pois a mesma instância é compartilhada pelo orquestrador)
+        self._local = threading.local()
     
     def is_text_based(self, pdf_bytes: bytes) -> bool:
         """Determine if PDF is text-based or scanned image."""
@@ -31,6 +273,8 @@ class TextExtractor:
     def extract(self, pdf_bytes: bytes, filename: str, check_cancel: callable = None) -> FiscalDocument:
         """Extract fiscal document data from text-based PDF."""
         doc = FiscalDocument(filename=filename)
+        self._local.words_cache = {}
+        self._local.page_text_cache = {}
         
         try:
             with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
@@ -39,6 +283,7 @@ class TextExtractor:
                 for page in pdf.pages:
                     page_text = page.extract_text() or ""
                     full_text += page_text + "\n"
+                    self._local.page_text_cache[id(page)] = page_text.upper()
                 
                 if not full_text.strip():
                     raise ValueError("No text content found in PDF")
@@ -50,7 +295,9 @@ class TextExtractor:
                     return doc
                 
                 # EXTRAÇÃO RÁPIDA POR REGEX (sem IA - Ollama não está funcionando)
-                doc.document_type = self._detect_document_type(full_text)
+                # Cópia em maiúsculas feita uma única vez e compartilhada pelos extratores
+                text_upper = full_text.upper()
+                doc.document_type = self._detect_document_type(full_text, text_upper)
                 
                 # PRIORIDADE 1: Extrair número do nome do arquivo (mais confiável)
                 doc.numero = self._extract_numero_from_filename(filename)
@@ -66,8 +313,8 @@ class TextExtractor:
                 doc.data_emissao = self._extract_data_emissao(full_text)
                 doc.data_saida_entrada = self._extract_data_saida_entrada(full_text)
                 doc.data_competencia = self._extract_data_competencia(full_text)
-                doc.emitente = self._extract_emitente(full_text, pdf=pdf)
-                doc.destinatario = self._extract_destinatario(full_text, pdf=pdf)
+                doc.emitente = self._extract_emitente(full_text, pdf=pdf, text_upper=text_upper)
+                doc.destinatario = self._extract_destinatario(full_text, pdf=pdf, text_upper=text_upper)
                 doc.valores = self._extract_valores(full_text, pdf)
                 
                 # Extract retentions (NFS-e only)
@@ -99,6 +346,10 @@ class TextExtractor:
         except Exception as e:
             logger.error(f"Error extracting from {filename}: {e}")
             doc.error_message = str(e)
+        finally:
+            # Páginas são descartadas com o PDF; id(page) não pode ser reaproveitado
+            self._local.words_cache = None
+            self._local.page_text_cache = None
         
         return doc
     
@@ -111,7 +362,7 @@ class TextExtractor:
                 num_clean = str(num).replace(" ", "").replace("-", "").replace(".", "")
                 # Validar: não aceitar chave de acesso ou CNPJ
                 if len(num_clean) <= 10 and len(num_clean) != 14:
-                    doc.numero = num
+                    doc.numero = str(num)
                     logger.info(f"Número '{num}' preenchido via IA")
         
         # Emitente
@@ -120,9 +371,9 @@ class TextExtractor:
             if emitente_data and emitente_data.get("nomeRazaoSocial"):
                 if not doc.emitente:
                     doc.emitente = Entity()
-                doc.emitente.razao_social = emitente_data.get("nomeRazaoSocial")
+                doc.emitente.razao_social = str(emitente_data.get("nomeRazaoSocial"))
                 if not doc.emitente.cnpj and emitente_data.get("cnpjCpf"):
-                    doc.emitente.cnpj = emitente_data.get("cnpjCpf")
+                    doc.emitente.cnpj = Entity.validate_cnpj(emitente_data.get("cnpjCpf"))
                 logger.info(f"Emitente preenchido via IA: {doc.emitente.razao_social}")
         
         # Destinatário
@@ -131,9 +382,9 @@ class TextExtractor:
             if dest_data and dest_data.get("nomeRazaoSocial"):
                 if not doc.destinatario:
                     doc.destinatario = Entity()
-                doc.destinatario.razao_social = dest_data.get("nomeRazaoSocial")
+                doc.destinatario.razao_social = str(dest_data.get("nomeRazaoSocial"))
                 if not doc.destinatario.cnpj and dest_data.get("cnpjCpf"):
-                    doc.destinatario.cnpj = dest_data.get("cnpjCpf")
+                    doc.destinatario.cnpj = Entity.validate_cnpj(dest_data.get("cnpjCpf"))
                 logger.info(f"Destinatário preenchido via IA: {doc.destinatario.razao_social}")
     
     def _map_ai_result_to_document(self, ai_result: dict, filename: str) -> FiscalDocument:
@@ -149,9 +400,9 @@ class TextExtractor:
         else:
             doc.document_type = DocumentType.UNKNOWN
         
-        # Número e chave
-        doc.numero = ai_result.get("numeroDocumento")
-        doc.chave_acesso = ai_result.get("chaveAcessoNFe")
+        # Número e chave (sem validate_assignment: normalizar para str aqui)
+        doc.numero = str(ai_result.get("numeroDocumento") or "") or None
+        doc.chave_acesso = FiscalDocument.validate_chave_acesso(ai_result.get("chaveAcessoNFe"))
         
         # VALIDAÇÃO: Rejeitar números que parecem ser chave de acesso ou CNPJ
         if doc.numero:
@@ -211,9 +462,10 @@ class TextExtractor:
         
         return doc
     
-    def _detect_document_type(self, text: str) -> DocumentType:
+    def _detect_document_type(self, text: str, text_upper: Optional[str] = None) -> DocumentType:
         """Detect if document is NF-e or NFS-e"""
-        text_upper = text.upper()
+        if text_upper is None:
+            text_upper = text.upper()
         
         # NFS-e patterns
         nfse_patterns = ['NFS-E', 'NOTA FISCAL DE SERVIÇO', 'NOTA FISCAL DE SERVIÇOS', 
@@ -291,7 +543,7 @@ class TextExtractor:
             # [FIX] NFS-e Barueri FORPONTO: "Número da Nota" seguido de número 6 dígitos em linha separada
             # Texto OCR: linha 10 "Número da Nota Série da Nota" ... linha 14 "002544"
             # O número aparece SOZINHO em uma linha, começando com 00
-            r'N[úu]mero\s+da\s+Nota[^\n]*\n(?:[^\n]*\n){0,5}\s*(00\d{4,6})\s*$',
+            r'N[úu]mero\s+da\s+Nota[^\n]*+\n(?:[^\n]*+\n){0,5}\s*(00\d{4,6})\s*$',
             
             # [FIX] NFS-e Barueri: Número vem DEPOIS do código de autenticidade na mesma linha
             # Texto: "493Q.0820.8311.1890799-S 000016" - captura os 6 dígitos após o código
@@ -488,7 +740,7 @@ class TextExtractor:
         for pattern in label_patterns:
             match = re.search(pattern, text, re.IGNORECASE)
             if match:
-                digits = re.sub(r'\D', '', match.group(1))
+                digits = digits_only(match.group(1))
                 if len(digits) == 44: return digits
         
         continuous = re.search(r'\b(\d{44})\b', text)
@@ -496,16 +748,14 @@ class TextExtractor:
         
         blocks = re.search(r'(\d{4}[\s\.]\d{4}[\s\.]\d{4}[\s\.]\d{4}[\s\.]\d{4}[\s\.]\d{4}[\s\.]\d{4}[\s\.]\d{4}[\s\.]\d{4}[\s\.]\d{4}[\s\.]\d{4})', text)
         if blocks:
-            digits = re.sub(r'\D', '', blocks.group(1))
+            digits = digits_only(blocks.group(1))
             if len(digits) == 44: return digits
         return None
     
     # ==================== DATE EXTRACTION ====================
     def _extract_date_near_label(self, text: str, labels: List[str]) -> Optional[datetime.date]:
-        date_pattern = r'(\d{2})[/\-\.](\d{2})[/\-\.](\d{4})'
         for label in labels:
-            pattern = rf'{label}[:\s]*{date_pattern}'
-            match = re.search(pattern, text, re.IGNORECASE)
+            match = _date_label_pattern(label).search(text)
             if match:
                 try:
                     day, month, year = int(match.group(1)), int(match.group(2)), int(match.group(3))
@@ -545,10 +795,28 @@ class TextExtractor:
         return self._extract_date_near_label(text, labels)
     
     # ==================== ENTITY EXTRACTION ====================
+    def _search_labeled_cnpj(self, text_upper: str, patterns: List["re.Pattern"]) -> Optional[str]:
+        """
+        Return the first valid CNPJ/CPF captured by the labeled patterns, in priority order.
+
+        Every labeled pattern contains the literal 'CNPJ', so documents without
+        it skip the regex passes entirely.
+        """
+        if 'CNPJ' not in text_upper:
+            return None
+        for pattern in patterns:
+            match = pattern.search(text_upper)
+            if match:
+                cnpj = digits_only(match.group(1))
+                if len(cnpj) in (11, 14):
+                    return cnpj
+        return None
+    
     def _find_all_cnpjs(self, text: str) -> List[str]:
         pattern = r'\b\d{2}\.?\d{3}\.?\d{3}/?\.?\d{4}-?\d{2}\b'
         matches = re.findall(pattern, text)
-        return [re.sub(r'\D', '', m) for m in matches if len(re.sub(r'\D', '', m)) == 14]
+        digits = [digits_only(m) for m in matches]
+        return [d for d in digits if len(d) == 14]
     
     def _check_name_blacklist(self, name: str) -> bool:
         """[FIX] Validação centralizada de nomes"""
@@ -580,21 +848,20 @@ class TextExtractor:
                  found_reliable_name = True
         
         # 1. Section
-        section = self._find_section(text, 
-            # [FIX] Usar label completo 'PRESTADOR DE SERVIÇOS' com prioridade
-            start_labels=['PRESTADOR DE SERVIÇOS', 'EMITENTE', 'PRESTADOR', 'DADOS DO PRESTADOR'],
-            # [FIX] Usar 'TOMADOR DE SERVIÇOS' como end_label completo
-            end_labels=['TOMADOR DE SERVIÇOS', 'DESTINAT', 'TOMADOR', 'DADOS DO TOMADOR', 'VALORES', 'ITENS', 'DISCRIMINAÇÃO']
-        )
-        
-        # [FIX] NFS-e Guarulhos: Verificar padrão "Prestador do Serviço NOME" ANTES de processar seção
-        # Alguns layouts têm nome na mesma linha do label, não na seção
-        prestador_inline_match = re.search(r'Prestador\s+do\s+Servi[çc]o\s+([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.&\-]{3,30}?)(?:\n|$)', text, re.IGNORECASE)
-        prestador_inline_name = prestador_inline_match.group(1).strip() if prestador_inline_match else None
+        section = self._find_section(text, self.EMITENTE_START_LABELS, self.EMITENTE_END_LABELS)
         
         if section:
             section_entity = self._parse_entity_from_section(section)
             if section_entity.cnpj:
+                if found_reliable_name: # Protege nome espacial (ajustes abaixo seriam descartados)
+                    section_entity.razao_social = entity.razao_social
+                    return section_entity
+                
+                # [FIX] NFS-e Guarulhos: Verificar padrão "Prestador do Serviço NOME"
+                # Alguns layouts têm nome na mesma linha do label, não na seção
+                prestador_inline_match = _PRESTADOR_INLINE_RE.search(text)
+                prestador_inline_name = prestador_inline_match.group(1).strip() if prestador_inline_match else None
+                
                 # [FIX] Se razao_social é inválida (muito curta ou logo), buscar alternativa
                 if section_entity.razao_social and len(section_entity.razao_social) < 12:
                     # Buscar linha com sufixo empresarial na seção
@@ -602,13 +869,13 @@ class TextExtractor:
                     for line in section.split('\n'):
                         line = line.strip()
                         # Ignorar linhas de label (começam com Nome, Razão, CPF, etc)
-                        if re.match(r'^(?:Nome|Razão|Raz[ãa]o|CPF|CNPJ|Inscrição|Endereço)', line, re.IGNORECASE):
+                        if _SECTION_LABEL_LINE_RE.match(line):
                             continue
-                        if len(line) >= 15 and re.search(r'(?:LTDA|S\.?A\.?|ME|EPP|EIRELI|S/A)\b', line, re.IGNORECASE):
+                        if len(line) >= 15 and _COMPANY_SUFFIX_WORD_RE.search(line):
                             # Limpar caracteres extras no final (logos, pipes)
-                            better_name = re.sub(r'\s*[|]\s*.*$', '', line).strip()
+                            better_name = _TRAILING_PIPE_RE.sub('', line).strip()
                             # Verificar se começa com letra e é razoável
-                            if re.match(r'^[A-ZÀ-Ú]', better_name) and len(better_name) >= 15:
+                            if _STARTS_WITH_LETTER_RE.match(better_name) and len(better_name) >= 15:
                                 section_entity.razao_social = better_name[:100]
                                 logger.info(f"Salvador fallback razao_social: {section_entity.razao_social}")
                                 break
@@ -620,13 +887,10 @@ class TextExtractor:
                 # [FIX] Guarulhos: Verificar se razao_social parece um bairro/localidade
                 # Nomes como "CIDADE INDL SA" são provavelmente locais, não empresas
                 if section_entity.razao_social and prestador_inline_name:
-                    bad_keywords = ['CIDADE', 'BAIRRO', 'CENTRO', 'VILA', 'JARDIM', 'PARQUE']
-                    if any(kw in section_entity.razao_social.upper() for kw in bad_keywords):
+                    if _LOCATION_KEYWORD_RE.search(section_entity.razao_social):
                         section_entity.razao_social = prestador_inline_name
                         logger.info(f"Guarulhos location-name fix: {section_entity.razao_social}")
                         
-                if found_reliable_name: # Protege nome espacial
-                    section_entity.razao_social = entity.razao_social
                 return section_entity
             # [FIX] Mesmo sem CNPJ, preservar razão social da seção se encontrada
             if section_entity.razao_social and self._check_name_blacklist(section_entity.razao_social):
@@ -635,61 +899,26 @@ class TextExtractor:
             if section_entity.endereco:
                 entity.endereco = section_entity.endereco
         # 2. Global CNPJ
-        cnpj_patterns = [
-            r'CPF/CNPJ[:\s]*([\d\.\/-]+)', r'CNPJ/CPF[:\s]*([\d\.\/-]+)', r'CNPJ[:\s]*([\d\.\/-]+)',
-            r'(?:CNPJ\s+(?:do\s+)?(?:Emitente|Prestador))[:\s]*([\d\.\/-]+)',
-            r'(?:Prestador|Emitente)[:\s]*CNPJ[:\s]*([\d\.\/-]+)',
-        ]
-        for pattern in cnpj_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                cnpj = re.sub(r'\D', '', match.group(1))
-                if len(cnpj) in [11, 14]:
-                    entity.cnpj = cnpj
-                    break
+        text_upper = kwargs.get('text_upper')
+        if text_upper is None:
+            text_upper = text.upper()
+        entity.cnpj = self._search_labeled_cnpj(text_upper, _EMITENTE_CNPJ_PATTERNS)
         
         if not entity.cnpj:
             all_cnpjs = self._find_all_cnpjs(text)
             if all_cnpjs: entity.cnpj = all_cnpjs[0]
         # 3. Regex Fallback (Only if we don't have a reliable name from Spatial)
         if not found_reliable_name and not entity.razao_social:
-            name_patterns = [
-                # [FIX] NFS-e ADL: nome antes de "Nº:" ou variações OCR (N5:, No:, N0:) na mesma linha
-                # Texto OCR DPI 400: "A DE L SIQUEIRA ME Nº: 7354" 
-                # Texto OCR DPI 200: "+ 4 DE L SIQUEIRA ME N5: 7354" (começa corrompido)
-                r'(?:\n|^).{0,3}([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.&\-]{5,50}?)\s*N[º°5oO0]:\s*\d+',
-                
-                # [FIX] NFS-e Guarulhos RENOSUL: nome na MESMA LINHA após "Prestador do Serviço"
-                # Texto OCR: "Prestador do Serviço RENOSUL\n" - nome direto após label até quebra de linha
-                r'Prestador\s+do\s+Servi[çc]o\s+([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.&\-]{3,30}?)(?:\n|$)',
-                
-                # Padrão NFS-e SP: linha após "Nome/NomeEmpresarial" contém "CNPJ_parcialNOME"
-                # Ex: "35.600.304FABIOLUIZSANTOSSILVA"
-                r'Nome/?NomeEmpresarial[^\n]*\n[\d\.\-/]+([A-Z][A-Z]+(?:[A-Z]+)*)\s',
-                
-                # Padrão alternativo: CNPJ.NNN seguido de nome em maiúsculas
-                r'\d{2}\.\d{3}\.\d{3}([A-Z][A-Z]+(?:[A-Z]+)*)\s',
-                
-                # Padrão NFS-e SP: "Nome / Nome Empresarial: CNPJ NOME"
-                r'Nome\s*/?\.?\s*Nome\s+Empresarial[:\s]*[\d\.\-/]+\s*([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]+)',
-                
-                # Padrão: linha seguinte após "EMITENTE DA NFS-e" ou "Prestador do Serviço"
-                r'(?:EMITENTE|PRESTADOR)[^\n]*\n[^\n]*\n\s*([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]{5,})',
-                
-                r'Nome\s*/\s*Nome\s+Empresarial[:\s]*([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\.\&\-]+)',
-                r'(?:Raz[ãa]o\s+Social|Nome\s+(?:do\s+)?(?:Emitente|Prestador))[:\s]*([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\.\&\-]+)',
-                r'(?:Prestador|Emitente)[:\s]*(?:Raz[ãa]o\s+Social)?[:\s]*([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]{5,})',
-            ]
-            for pattern in name_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
+            for pattern in _EMITENTE_NAME_PATTERNS:
+                match = pattern.search(text)
                 if match:
                     name = match.group(1).strip()
                     # Limpar números iniciais que podem ser CNPJ parcial
-                    name = re.sub(r'^[\d\.\-/]+', '', name).strip()
+                    name = _NAME_LEAD_RE.sub('', name).strip()
                     # Adicionar espaços antes de maiúsculas (para nomes colados)
                     if name.isupper() and ' ' not in name and len(name) > 10:
                         # Inserir espaços antes de cada maiúscula (exceto a primeira)
-                        name = re.sub(r'([A-Z])([A-Z][a-z])', r'\1 \2', name)
+                        name = _NAME_CAMEL_RE.sub(r'\1 \2', name)
                         # Se ainda não tem espaços, é provavelmente tudo maiúsculo colado
                         if ' ' not in name:
                             # Nome pode estar colado, mas manteremos assim
@@ -699,28 +928,14 @@ class TextExtractor:
                         logger.info(f"Extracted razao_social: {entity.razao_social}")
                         break
         
-        if section and not entity.endereco:
-            entity.endereco = self._extract_address(section)
-        
+        # Endereço da seção já foi extraído por _parse_entity_from_section (acima)
         return entity if entity.cnpj or entity.razao_social else None
     
     def _extract_destinatario(self, text: str, **kwargs) -> Optional[Entity]:
         entity = Entity()
         found_reliable_name = False
-        if 'pdf' in kwargs and kwargs['pdf']:
-             pdf = kwargs['pdf']
-             spatial_name = self._extract_text_spatial(
-                 pdf, ['Nome / Nome Empresarial do Tomador', 'Razão Social do Tomador', 'Tomador de Serviços', 'Destinatário'], 
-                 r'([A-ZÀ-Ú\s\.]+)', force_vertical=True)
-             if spatial_name and self._check_name_blacklist(spatial_name):
-                 entity.razao_social = spatial_name
-                 found_reliable_name = True
-        section = self._find_section(text,
-            # [FIX] Usar label completo 'TOMADOR DE SERVIÇOS' com prioridade para evitar cortar em 'SERVIÇOS'
-            start_labels=['TOMADOR DE SERVIÇOS', 'DESTINAT', 'TOMADOR', 'DADOS DO TOMADOR', 'CLIENTE'],
-            # [FIX] Remover 'SERVIÇOS' para evitar cortar seção 'TOMADOR DE SERVIÇOS' prematuramente
-            end_labels=['INTERMEDIÁRIO', 'VALORES', 'ITENS', 'DISCRIMINAÇÃO', 'PRODUTOS', 'TOTAL']
-        )
+        # Seção primeiro: se ela já resolve CNPJ ou nome, a busca espacial seria descartada
+        section = self._find_section(text, self.DESTINATARIO_START_LABELS, self.DESTINATARIO_END_LABELS)
         if section:
             section_entity = self._parse_entity_from_section(section)
             if section_entity.cnpj: return section_entity
@@ -728,49 +943,57 @@ class TextExtractor:
             if section_entity.razao_social and self._check_name_blacklist(section_entity.razao_social):
                 entity.razao_social = section_entity.razao_social
                 found_reliable_name = True  # Proteger contra sobrescrita pelo fallback
+            # Reaproveitar o endereço já extraído da seção (evita nova varredura)
+            entity.endereco = section_entity.endereco
         
-        cnpj_patterns = [
-            r'(?:CNPJ\s+(?:do\s+)?(?:Destinat[áa]rio|Tomador|Cliente))[\s:]*([d\.\/-]+)',
-            r'(?:Destinat[áa]rio|Tomador)[:\s]*CNPJ[:\s]*([\d\.\/-]+)',
-            r'(?:CPF/CNPJ\s+(?:do\s+)?(?:Tomador|Cliente))[:\s]*([\d\.\/-]+)',
-        ]
-        for pattern in cnpj_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                cnpj = re.sub(r'\D', '', match.group(1))
-                if len(cnpj) in [11, 14]:
-                    entity.cnpj = cnpj
-                    break
+        if not found_reliable_name and 'pdf' in kwargs and kwargs['pdf']:
+             pdf = kwargs['pdf']
+             spatial_name = self._extract_text_spatial(
+                 pdf, ['Nome / Nome Empresarial do Tomador', 'Razão Social do Tomador', 'Tomador de Serviços', 'Destinatário'], 
+                 r'([A-ZÀ-Ú\s\.]+)', force_vertical=True)
+             if spatial_name and self._check_name_blacklist(spatial_name):
+                 entity.razao_social = spatial_name
+                 found_reliable_name = True
+        
+        text_upper = kwargs.get('text_upper')
+        if text_upper is None:
+            text_upper = text.upper()
+        entity.cnpj = self._search_labeled_cnpj(text_upper, _DESTINATARIO_CNPJ_PATTERNS)
         
         if not entity.cnpj:
             all_cnpjs = self._find_all_cnpjs(text)
             if len(all_cnpjs) >= 2: entity.cnpj = all_cnpjs[1]
         
         if not found_reliable_name and not entity.razao_social:
-            name_patterns = [
-                r'(?:Raz[ãa]o\s+Social|Nome\s+(?:do\s+)?(?:Destinat[áa]rio|Tomador|Cliente))[:\s]*([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\.\&\-]+)',
-                r'(?:Destinat[áa]rio|Tomador)[:\s]*(?:Raz[ãa]o)?[:\s]*([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]{5,})',
-            ]
-            for pattern in name_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
+            for pattern in _DESTINATARIO_NAME_PATTERNS:
+                match = pattern.search(text)
                 if match:
                     name = match.group(1).strip()
                     if self._check_name_blacklist(name):
                         entity.razao_social = name.split('\n')[0].strip()[:100]
                         break
         
-        if section: entity.endereco = self._extract_address(section)
         return entity if entity.cnpj or entity.razao_social else None
-    def _find_section(self, text: str, start_labels: List[str], end_labels: List[str]) -> Optional[str]:
-        text_upper = text.upper()
+    def _find_section(self, text: str, start_labels: Tuple[str, ...], end_labels: Tuple[str, ...]) -> Optional[str]:
+        """
+        Return the text between the best start label and the nearest end label.
+
+        Works on the original text (no upper() copy); the label scanners are
+        compiled once per label tuple, so repeated calls only cost the scan.
+        """
+        # Uma única varredura para todos os labels de início: vence o label de maior
+        # prioridade (ordem da lista), na sua primeira ocorrência
         start_pos = -1
         found_label_len = 0
-        for label in start_labels:
-            pos = text_upper.find(label.upper())
-            if pos != -1:
-                start_pos = pos
-                found_label_len = len(label)
-                break
+        best_priority = len(start_labels)
+        for match in _label_scanner(tuple(start_labels)).finditer(text):
+            priority = match.lastindex - 1
+            if priority < best_priority:
+                best_priority = priority
+                start_pos = match.start()
+                found_label_len = len(start_labels[priority])
+                if priority == 0:
+                    break
         if start_pos == -1: return None
         
         # Avançar para após o label
@@ -782,82 +1005,47 @@ class TextExtractor:
         if newline_pos != -1:
             same_line_text = text[start_pos:newline_pos]
             # Se a mesma linha contém sufixo empresarial, manter o texto
-            has_company_name = bool(re.search(r'(?:LTDA|S\.?A\.?|ME|EPP|EIRELI|S/A)', same_line_text, re.IGNORECASE))
+            has_company_name = bool(_COMPANY_SUFFIX_RE.search(same_line_text))
             if not has_company_name and newline_pos < start_pos + 50:
                 start_pos = newline_pos + 1
         
-        end_pos = len(text)
-        for label in end_labels:
-            pos = text_upper.find(label.upper(), start_pos)
-            if pos != -1 and pos < end_pos: end_pos = pos
+        end_match = _label_scanner(tuple(end_labels)).search(text, start_pos)
+        end_pos = end_match.start() if end_match else len(text)
         section = text[start_pos:end_pos]
         logger.debug(f"_find_section found section (len={len(section)}): '{section[:100]}...' " if len(section) > 100 else f"_find_section found section (len={len(section)}): '{section}'")
         return section if len(section) > 20 else None
     
+    def _clean_name(self, name: str) -> str:
+        """Normalize a captured razão social (CNPJ prefix, OCR label residue, glued suffixes)."""
+        name = name.strip()
+        # Limpar números iniciais
+        name = _NAME_LEAD_RE.sub('', name).strip()
+        
+        # [FIX] Remover artefatos OCR de labels no início do nome
+        # IMPORTANTE: Só aplicar se o resultado for longo o suficiente (10+ chars)
+        cleaned_name = _NAME_LABEL_RE.sub('', name).strip()
+        if len(cleaned_name) >= 10:
+            name = cleaned_name
+        
+        # [FIX] Inserir espaços antes de sufixos empresariais colados
+        name = _NAME_SUFFIX_SA_RE.sub(r'\1 \2', name)
+        name = _NAME_SUFFIX_LTDA_RE.sub(r'\1 \2', name)
+        return name
+    
     def _parse_entity_from_section(self, section: str) -> Entity:
         entity = Entity()
         
-        # Padrões de CNPJ - ordem de prioridade
-        # [FIX] OCR às vezes lê ponto como vírgula e omite barra (ex: 15,572.1540001-25)
-        cnpj_patterns = [
-            # Padrão específico com label "CNPJ" ou "CPF/CNPJ" - muito flexível para OCR
-            r'C(?:PF[/\\I])?CN?PJ?[:\s.]+(\d{2}[.,]?\d{3}[.,]?\d{3}[/\\]?\d{4}[-]?\d{2})',
-            # Padrão genérico de CNPJ formatado (com separadores)
-            r'\b(\d{2}[.,]\d{3}[.,]\d{3}[/\\]\d{4}[-]?\d{2})\b',
-            # [FIX] Padrão OCR corrompido: números colados com vírgula/ponto (15,572.1540001-25)
-            r'\b(\d{2}[.,]\d{3}[.,]?\d{3,4}\d{4}[-]?\d{2})\b',
-        ]
-        
-        for pattern in cnpj_patterns:
-            cnpj_match = re.search(pattern, section, re.IGNORECASE)
+        for pattern in _SECTION_CNPJ_PATTERNS:
+            cnpj_match = pattern.search(section)
             if cnpj_match:
-                entity.cnpj = re.sub(r'\D', '', cnpj_match.group(1))
+                entity.cnpj = digits_only(cnpj_match.group(1))
                 logger.debug(f"Found CNPJ in section: {entity.cnpj}")
                 break
         
-        razao_patterns = [
-            # [FIX] NFS-e Barueri: Nome empresarial na 1ª linha da seção (sem label)
-            # Captura linha iniciando com maiúscula, terminando com sufixo empresarial
-            # PRIORIDADE MÁXIMA - padrão mais específico
-            r'^\s*([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]+(?:LTDA|S\.?A\.?|ME|EPP|EIRELI|S/A))\s*$',
-            
-            # [FIX] Alternativo: qualquer linha com sufixo empresarial
-            r'([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]{5,}(?:LTDA|S\.?A\.?|ME|EPP|EIRELI|S/A))',
-            
-            # [FIX] NFS-e Salvador: nome empresa pode estar em linha após "Nome/Razão Social:"
-            # Ex: "Nome/Razão Social: polo ir\nPITECNOLOGIA DA INFORMAÇÃO LTDA - ME"
-            r'Nome/Raz[ãa]o\s+Social:[^\n]*\n([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]+(?:LTDA|S\.?A\.?|ME|EPP|EIRELI|S/A)[^\n]*)',
-            
-            # Padrão NFS-e SP: CNPJ.parcial seguido de nome colado (ex: 35.600.304FABIOLUIZSANTOSSILVA)
-            r'\d{2}\.\d{3}\.\d{3}([A-Z][A-Z]+(?:[A-Z]+)*)\s',
-            
-            # [FIX] DANFSe v1.0 (Itatiba/BH): "Nome/NomeEmpresarial E-mail\nTOTVSS.A. email@..."
-            # Captura nome colado em maiúsculas após label colado
-            r'Nome/NomeEmpresarial\s+E-?mail\n([A-ZÀ-Ú][A-ZÀ-Ú0-9\.\,\-]+?)(?:\s+[A-Za-z0-9@\._-]+@|\n)',
-            
-            # [FIX] OCR NFS-e SP: caracteres extras antes de "Razão Social" (ex: "HNomesRazão", "MomeiRazão")
-            # Ignora caracteres antes e captura nome após ":", "." ou espaços
-            r'(?:Nome.?)?Raz[ãa]o\s+Social[:\.\s]+([A-ZÀ-Ú][A-ZÀ-Ú0-9\s\.\&\-]+)',
-            
-            # Padrões genéricos - EXCLUIR "Nome Tomador" para evitar falsos positivos
-            r'Raz[ãa]o\s+Social[:\s]*([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\.\&\-]+)',
-        ]
-        for pattern in razao_patterns:
-            match = re.search(pattern, section, re.IGNORECASE | re.MULTILINE)
+        for pattern in _SECTION_RAZAO_PATTERNS:
+            match = pattern.search(section)
             if match:
-                name = match.group(1).strip()
-                # Limpar números iniciais
-                name = re.sub(r'^[\d\.\-/]+', '', name).strip()
-                
-                # [FIX] Remover artefatos OCR de labels no início do nome
-                # IMPORTANTE: Só aplicar se o resultado for longo o suficiente (10+ chars)
-                cleaned_name = re.sub(r'^.*?(?:Raz[ãa]o|Social|Nome|Razao)\s+(?:Social\s+)?', '', name, flags=re.IGNORECASE).strip()
-                if len(cleaned_name) >= 10:
-                    name = cleaned_name
-                
-                # [FIX] Inserir espaços antes de sufixos empresariais colados
-                name = re.sub(r'([A-ZÀ-Ú])(S\.A\.|S\.A|SA|S/A)$', r'\1 \2', name, flags=re.IGNORECASE)
-                name = re.sub(r'([A-ZÀ-Ú])(LTDA|ME|EPP|EIRELI)$', r'\1 \2', name, flags=re.IGNORECASE)
+                name = self._clean_name(match.group(1))
                 
                 # [FIX] Rejeitar nomes muito curtos e tentar próximo padrão
                 if len(name) < 10:
@@ -871,7 +1059,7 @@ class TextExtractor:
                     continue
                 
                 # [FIX] Nome deve ter sufixo empresarial ou ser longo o suficiente
-                has_suffix = any(s in name.upper() for s in ['LTDA', 'S.A', 'SA', 'ME', 'EPP', 'EIRELI', 'S/A'])
+                has_suffix = bool(_COMPANY_SUFFIX_RE.search(name))
                 if has_suffix or len(name) >= 15:
                     entity.razao_social = name.split('\n')[0].strip()[:100]
                     logger.info(f"Parsed razao_social from section: {entity.razao_social}")
@@ -883,21 +1071,15 @@ class TextExtractor:
     # ==================== ADDRESS EXTRACTION ====================
     def _extract_address(self, text: str) -> Optional[Address]:
         address = Address()
-        log_patterns = [
-            # [FIX] NFS-e Barueri: Endereço multi-linha começando com RUA/AVENIDA
-            # Ex: "RUA POMPEIA , 368\nCHACARAS MARCO / CRUZ PRETA\nCEP 06419-140 - BARUERI - SP"
-            r'((?:RUA|AVENIDA|AV\.?)\s+[A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\,\.\-]+?)(?=\n.*CNPJ|\n.*Inscrição|\n.*Telefone|$)',
-            
-            # Padrão NFS-e SP: linha após "Endereço Município CEP" contém endereço colado
-            # Ex: "FABIODEALMEIDAMAGALHAES,120,JARDIMSANTOELIAS SãoPaulo-SP 5135370"
-            r'Endere[çc]o\s+Munic[íi]pio\s+CEP\n([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\,\s\.\-]+?)(?:\s+[A-ZÀ-Ú][a-zà-ú]+(?:Paulo|Janeiro)?-?[A-Z]{2})',
-            
-            # Padrão genérico: endereço na mesma linha
-            r'(?:Endere[çc]o|Logradouro)[:\s]*([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\.\,\-]+?)(?=\s*(?:N[°ºo]|Num|,|\n|Bairro|CEP|$))',
-            r'(?:Rua|Avenida|Av\.|Travessa|Alameda)\s+([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\.\-]+?)(?=\s*(?:,|N[°º]|\n|$))',
-        ]
-        for pattern in log_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        # Labels obrigatórios de cada padrão: se não aparecem, a varredura é pulada
+        text_upper = text.upper()
+        has_bairro = 'BAIRRO' in text_upper
+        has_city = 'MUNIC' in text_upper or 'CIDADE' in text_upper
+        has_cep_label = 'CEP' in text_upper
+        has_uf_label = 'UF' in text_upper or 'ESTADO' in text_upper
+        
+        for pattern in _ADDRESS_LOG_PATTERNS:
+            match = pattern.search(text)
             if match:
                 val = match.group(1).strip().rstrip(',')
                 if len(val) > 3:
@@ -905,40 +1087,36 @@ class TextExtractor:
                     logger.debug(f"Extracted address: {address.logradouro}")
                     break
         
-        num_patterns = [r'(?:N[°ºo]|Num(?:ero)?)[:\.\s]*(\d+[A-Z]?)']
-        for pattern in num_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in _ADDRESS_NUM_PATTERNS:
+            match = pattern.search(text)
             if match:
                 address.numero = match.group(1)
                 break
         
-        bairro_patterns = [r'Bairro[:\s]*([A-ZÀ-Ú0-9][A-ZÀ-Ú0-9\s\.\-]+?)(?=\s*(?:Munic|Cidade|UF|CEP|\n|$))']
-        for pattern in bairro_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in _ADDRESS_BAIRRO_PATTERNS if has_bairro else ():
+            match = pattern.search(text)
             if match:
                 val = match.group(1).strip()
                 if len(val) > 2:
                     address.bairro = val[:50]
                     break
         
-        city_patterns = [r'(?:Munic[íi]pio|Cidade)[:\s]*([A-ZÀ-Ú][A-ZÀ-Ú\s\-]+?)(?=\s*(?:UF|Estado|CEP|/|\n|$))']
-        for pattern in city_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in _ADDRESS_CITY_PATTERNS if has_city else ():
+            match = pattern.search(text)
             if match:
                 val = match.group(1).strip()
                 if len(val) > 2:
                     address.municipio = val[:50]
                     break
         
-        cep_match = re.search(r'CEP[:\s]*(\d{5}-?\d{3})', text, re.IGNORECASE)
+        cep_match = _ADDRESS_CEP_LABEL_RE.search(text) if has_cep_label else None
         if cep_match: address.cep = cep_match.group(1)
         else:
-            cep_match = re.search(r'\b(\d{5}-\d{3})\b', text)
+            cep_match = _ADDRESS_CEP_RE.search(text)
             if cep_match: address.cep = cep_match.group(1)
         
-        uf_patterns = [r'(?:UF|Estado)[:\s]*([A-Z]{2})\b']
-        for pattern in uf_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in _ADDRESS_UF_PATTERNS if has_uf_label else ():
+            match = pattern.search(text)
             if match:
                 uf = match.group(1).upper()
                 if uf in self.BRAZILIAN_STATES:
@@ -946,32 +1124,48 @@ class TextExtractor:
                     break
         
         if not address.uf:
-            for state in self.BRAZILIAN_STATES:
-                if re.search(rf'\b{state}\b', text):
-                    address.uf = state
-                    break
+            state_match = self._BR_STATE_RE.search(text)
+            if state_match:
+                address.uf = state_match.group(1)
         
         has_data = any([address.logradouro, address.bairro, address.municipio, address.cep])
         return address if has_data else None
     
     # ==================== VALUE EXTRACTION ====================
     def _parse_monetary_value(self, value_str: str) -> Optional[float]:
-        if not value_str: return None
-        try:
-            clean = value_str.replace('R$', '').strip()
-            clean = clean.replace(' ', '')
-            if ',' in clean and '.' in clean:
-                clean = clean.replace('.', '').replace(',', '.')
-            elif ',' in clean:
-                clean = clean.replace(',', '.')
-            return float(clean)
-        except: return None
+        return parse_monetary_value(value_str)
     def _extract_value_spatial(self, pdf: pdfplumber.PDF, keywords: List[str]) -> Optional[float]:
         val_str = self._extract_text_spatial(pdf, keywords, r'R?\$\s*([\d\.]+(?:,\d{2})?)')
         if val_str:
              match = re.search(r'R?\$\s*([\d\.]+(?:,\d{2})?)', val_str)
              if match: return self._parse_monetary_value(match.group(1))
         return None
+    def _get_words(self, page) -> Tuple[List[Dict[str, Any]], List[float], List[float], List[str]]:
+        """
+        Return the page words sorted top-down/left-right plus their 'top' index,
+        horizontal centers and uppercased texts.
+
+        extract_words() is the most expensive pdfplumber call, so the result is
+        memoized per page for the duration of the current extract().
+        """
+        cache = getattr(self._local, 'words_cache', None)
+        key = id(page)
+        if cache is not None and key in cache:
+            return cache[key]
+        
+        words = page.extract_words()
+        # Sort: Top-down, Left-right
+        words.sort(key=lambda w: (w['top'], w['x0']))
+        entry = (
+            words,
+            [w['top'] for w in words],
+            [(w['x0'] + w['x1']) / 2 for w in words],
+            [w['text'].upper() for w in words],
+        )
+        if cache is not None:
+            cache[key] = entry
+        return entry
+    
     def _extract_text_spatial(self, pdf: pdfplumber.PDF, keywords: List[str], content_pattern: str, force_vertical: bool = False) -> Optional[str]:
         """
         Generic spatial extractor with PROXIMITY logic.
@@ -982,15 +1176,25 @@ class TextExtractor:
         """
         best_match = None
         min_distance = float('inf')
+        # Invariantes da chamada: calculados uma vez, não por palavra/match
+        content_re = re.compile(content_pattern)
+        is_money = 'R$' in content_pattern
+        keywords_upper = [k.upper() for k in keywords]
+        page_text_cache = getattr(self._local, 'page_text_cache', None) or {}
         try:
             for page in pdf.pages:
-                words = page.extract_words()
-                # Sort: Top-down, Left-right
-                words.sort(key=lambda w: (w['top'], w['x0']))
+                # Página sem nenhum keyword no texto não tem palavra candidata:
+                # pula extract_words() (o texto já foi extraído em extract())
+                page_upper = page_text_cache.get(id(page))
+                if page_upper is not None and not any(k in page_upper for k in keywords_upper):
+                    continue
                 
-                for word in words:
+                # Índice por 'top' (já ordenado) - as faixas direita/baixo viram bisect + fatia
+                words, tops, centers, texts_upper = self._get_words(page)
+                
+                for word, text_upper in zip(words, texts_upper):
                     # Check text match
-                    if any(k.upper() in word['text'].upper() for k in keywords):
+                    if any(k in text_upper for k in keywords_upper):
                         
                         candidates = []
                         # --- STRATEGY 1: LOOK RIGHT ---
@@ -999,19 +1203,15 @@ class TextExtractor:
                             y_bottom = word['bottom'] + 3
                             x_start_right = word['x1']
                             
-                            right_text = ""
                             # Find the immediate text sequence to the right
-                            current_sequence = []
-                            for candidate in words:
-                                if candidate['top'] >= y_top and candidate['bottom'] <= y_bottom:
-                                    if candidate['x0'] > x_start_right:
-                                        right_text += candidate['text'] + " "
-                                        current_sequence.append(candidate)
+                            band = words[bisect_left(tops, y_top):bisect_right(tops, y_bottom)]
+                            current_sequence = [c for c in band if c['bottom'] <= y_bottom and c['x0'] > x_start_right]
+                            right_text = "".join(c['text'] + " " for c in current_sequence)
                             
-                            matches = re.finditer(content_pattern, right_text)
+                            matches = content_re.finditer(right_text)
                             for m in matches:
                                  val = m.group(0) # or group(1) if capture group
-                                 if 'R$' in content_pattern and not any(c.isdigit() for c in val): continue
+                                 if is_money and not any(c.isdigit() for c in val): continue
                                  
                                  if current_sequence:
                                      dist = current_sequence[0]['x0'] - word['x1']
@@ -1022,42 +1222,38 @@ class TextExtractor:
                         y_start_down = word['bottom']
                         y_end_down = word['bottom'] + 35 # Look slightly deeper
                         
-                        down_text = ""
-                        down_sequence = []
-                        for candidate in words:
-                            if candidate['top'] >= y_start_down and candidate['top'] <= y_end_down:
-                                cand_center = (candidate['x0'] + candidate['x1']) / 2
-                                if cand_center >= x_start_down and cand_center <= x_end_down:
-                                     down_text += candidate['text'] + " "
-                                     down_sequence.append(candidate)
+                        lo = bisect_left(tops, y_start_down)
+                        hi = bisect_right(tops, y_end_down)
+                        down_sequence = [
+                            words[i] for i in range(lo, hi)
+                            if x_start_down <= centers[i] <= x_end_down
+                        ]
+                        down_text = "".join(c['text'] + " " for c in down_sequence)
                         
-                        matches = re.finditer(content_pattern, down_text)
+                        matches = content_re.finditer(down_text)
                         for m in matches:
                              val = m.group(0)
-                             if 'R$' in content_pattern and not any(c.isdigit() for c in val): continue
+                             if is_money and not any(c.isdigit() for c in val): continue
                              
                              if down_sequence:
                                  # Distance: Label Bottom to Word Top
                                  dist = down_sequence[0]['top'] - word['bottom']
                                  candidates.append((val, dist, 'down'))
                         # --- SELECTION ---
-                        down_matches = [c for c in candidates if c[2] == 'down']
+                        # (com force_vertical só existem candidatos 'down' - a busca à direita é pulada)
                         
                         # Filter bad matches logic
                         final_candidates = []
-                        all_cands = candidates if not force_vertical else down_matches
-                        
-                        for val, dist, direction in all_cands:
-                             if 'R$' not in content_pattern:
+                        for val, dist, direction in candidates:
+                             if not is_money:
                                 # Semantic validation for non-money fields
                                 if len(val) == 8 and val.startswith('20'): continue
                                 if '/' in val or '-' in val: continue
                              final_candidates.append((val, dist, direction))
                         
                         if final_candidates:
-                             # Sort by distance
-                             final_candidates.sort(key=lambda x: x[1])
-                             top_match = final_candidates[0]
+                             # Closest match (min é estável como o sort anterior)
+                             top_match = min(final_candidates, key=lambda x: x[1])
                              
                              if top_match[1] < min_distance:
                                  min_distance = top_match[1]
@@ -1454,42 +1650,11 @@ class TextExtractor:
         - Tabular: "PIS (R$)\n43,58"
         - Colado: "PISRetido 147,80"
         """
-        # Patterns specific to each tax
-        patterns = {
-            'PIS': [
-                rf'{tax_name}\s*(?:/PASEP)?\s+RETID[OA]\s*[:\s]*R?\$?\s*([\d\.,]+)',
-                rf'{tax_name}Retid[oa]\s*[:\s]*R?\$?\s*([\d\.,]+)',  # Colado
-                rf'RETEN[ÇC][ÃA]O\s+(?:DE\s+)?{tax_name}\s*[:\s]*R?\$?\s*([\d\.,]+)',
-            ],
-            'COFINS': [
-                rf'{tax_name}\s+RETID[OA]\s*[:\s]*R?\$?\s*([\d\.,]+)',
-                rf'{tax_name}Retid[oa]\s*[:\s]*R?\$?\s*([\d\.,]+)',  # Colado
-                rf'RETEN[ÇC][ÃA]O\s+(?:DE\s+)?{tax_name}\s*[:\s]*R?\$?\s*([\d\.,]+)',
-            ],
-            'CSLL': [
-                rf'{tax_name}\s+RETID[OA]\s*[:\s]*R?\$?\s*([\d\.,]+)',
-                rf'{tax_name}Retid[oa]\s*[:\s]*R?\$?\s*([\d\.,]+)',  # Colado
-                rf'RETEN[ÇC][ÃA]O\s+(?:DE\s+)?{tax_name}\s*[:\s]*R?\$?\s*([\d\.,]+)',
-            ],
-            'IRRF': [
-                rf'{tax_name}\s*[:\s]*R?\$?\s*([\d\.,]+)',
-                rf'IR\s+RETIDO\s*[:\s]*R?\$?\s*([\d\.,]+)',
-            ],
-            'INSS': [
-                rf'{tax_name}\s+RETIDO\s*[:\s]*R?\$?\s*([\d\.,]+)',
-                rf'{tax_name}Retido\s*[:\s]*R?\$?\s*([\d\.,]+)',  # Colado
-                rf'RETEN[ÇC][ÃA]O\s+(?:DE\s+)?{tax_name}\s*[:\s]*R?\$?\s*([\d\.,]+)',
-            ],
-            'ISS': [
-                rf'{tax_name}\s+RETIDO\s*[:\s]*R?\$?\s*([\d\.,]+)',
-                rf'{tax_name}\s+[Aa]\s+[Rr]ETER\s*[:\s]*R?\$?\s*([\d\.,]+)',
-                rf'RETEN[ÇC][ÃA]O\s+(?:DE\s+)?{tax_name}(?:QN)?\s*[:\s]*R?\$?\s*([\d\.,]+)',
-            ],
-        }
+        direct_patterns, label_patterns = _retention_patterns(tax_name)
         
         # Try direct patterns first
-        for pattern in patterns.get(tax_name, []):
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in direct_patterns:
+            match = pattern.search(text)
             if match:
                 value_str = match.group(1)
                 value = self._parse_monetary_value(value_str)
@@ -1498,14 +1663,8 @@ class TextExtractor:
                     return value
         
         # Proximity search: find label, then search nearby for value
-        label_patterns = [
-            rf'{tax_name}\s*(?:/PASEP)?\s*[\(\[]?R\$[\)\]]?',  # "PIS (R$)" or "PIS [R$]"
-            rf'{tax_name}\s+RETID[OA]',
-            rf'{tax_name}Retid[oa]',  # Colado
-        ]
-        
         for label_pattern in label_patterns:
-            label_match = re.search(label_pattern, text, re.IGNORECASE)
+            label_match = label_pattern.search(text)
             if label_match:
                 # Search in next 200 characters (2-3 lines)
                 context_start = label_match.end()
@@ -1513,7 +1672,7 @@ class TextExtractor:
                 context = text[context_start:context_end]
                 
                 # Find first monetary value
-                value_match = re.search(r'R?\$?\s*([\d\.]+[,]\d{2})', context)
+                value_match = _MONEY_VALUE_RE.search(context)
                 if value_match:
                     value_str = value_match.group(1)
                     value = self._parse_monetary_value(value_str)
@@ -1557,7 +1716,7 @@ class TextExtractor:
                     values_line = lines[i + 1]
                     
                     # Extract all monetary values from values line
-                    values = re.findall(r'R?\$?\s*([\d\.]+[,]\d{2})', values_line)
+                    values = _MONEY_VALUE_RE.findall(values_line)
                     
                     # Get value at the same position
                     if position < len(values):
@@ -1597,7 +1756,7 @@ class TextExtractor:
             if re.search(r'IRRF\s*,\s*CP\s*,\s*CSLL\s*[-]?\s*Retid[OAoa]s?', line, re.IGNORECASE):
                 if i + 1 < len(lines):
                     values_line = lines[i + 1]
-                    values = re.findall(r'R?\$?\s*([\d\.]+[,]\d{2})', values_line)
+                    values = _MONEY_VALUE_RE.findall(values_line)
                     
                     if len(values) > 0:
                         value_str = values[0]  # First value = CSLL
@@ -2,28 +2,157 @@
 Vision-based extraction using local Ollama instance with LLaVA model.
 """
 import base64
-import json
+import hashlib
+import io
+import orjson
+import os
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 import fitz  # PyMuPDF
-from typing import Optional, Dict, Any, List, Callable
+from PIL import Image
+from typing import Optional, Dict, Any, List, Callable, Tuple
 from datetime import datetime
 from loguru import logger
 
-from models import FiscalDocument, Entity, Address, TaxValues, ServiceItem, DocumentType
+from models import FiscalDocument, Entity, Address, TaxValues, ServiceItem, DocumentType, digits_only
+from core import llm_cache
+
+# Chave em "valores" (JSON do modelo) -> campo de TaxValues
+_VALORES_FIELDS = (
+    ("valor_total", "valor_total"),
+    ("valor_servicos", "valor_servicos"),
+    ("iss", "iss"),
+    ("pis", "pis"),
+    ("cofins", "cofins"),
+    ("inss", "inss"),
+    ("ir", "ir"),
+    ("csll", "csll_retida"),  # TaxValues não tem "csll"
+    ("valor_liquido", "valor_liquido"),
+)
+
+# Prompt fixo, montado uma única vez (sem a indentação do código, que só gastava tokens)
+_VISION_PROMPT = """
+Você é um especialista em extração de dados de documentos fiscais brasileiros (NF-e, NFS-e).
+Analise a imagem deste documento e extraia os dados abaixo em formato JSON.
+
+REGRAS:
+1. Responda APENAS com o JSON válido.
+2. Se um campo não existir ou estiver ilegível, use null.
+3. Valores monetários devem ser números (ex: 100.50).
+4. Datas devem ser YYYY-MM-DD.
+
+ESTRUTURA JSON DESEJADA:
+{
+    "tipo_documento": "NFS-e" | "NF-e",
+    "numero": "string (apenas dígitos)",
+    "serie": "string",
+    "chave_acesso": "string (44 dígitos)",
+    "data_emissao": "YYYY-MM-DD",
+    "emitente": {
+        "cnpj": "string (apenas dígitos)",
+        "razao_social": "string",
+        "endereco": "string"
+    },
+    "destinatario": {
+        "cnpj": "string (apenas dígitos)",
+        "razao_social": "string"
+    },
+    "valores": {
+        "valor_total": number,
+        "valor_servicos": number,
+        "iss": number,
+        "pis": number,
+        "cofins": number,
+        "ir": number,
+        "inss": number,
+        "csll": number,
+        "valor_liquido": number
+    }
+}
+"""
+
+# Pool de processos compartilhado para rasterização: o PyMuPDF não suporta uso a partir de
+# várias threads ao mesmo tempo, então a renderização paralela entre arquivos do lote roda
+# em processos. Criado sob demanda (nada de processos só por importar o módulo) e encerrado
+# pelo orchestrator ao fim de cada lote (shutdown_render_pool).
+_RENDER_POOL: Optional[ProcessPoolExecutor] = None
+_RENDER_POOL_LOCK = threading.Lock()
+
+
+def _get_render_pool() -> Optional[ProcessPoolExecutor]:
+    """Retorna o pool de renderização, ou None para renderizar no próprio processo."""
+    global _RENDER_POOL
+    # Dentro de um worker do orchestrator (use_processes) não aninhar outro pool
+    if multiprocessing.parent_process() is not None:
+        return None
+    with _RENDER_POOL_LOCK:
+        if _RENDER_POOL is None:
+            _RENDER_POOL = ProcessPoolExecutor(
+                max_workers=max((os.cpu_count() or 2) - 1, 1),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _RENDER_POOL
+
+
+def shutdown_render_pool():
+    """Encerra o pool de renderização (se criado); o próximo uso cria outro."""
+    global _RENDER_POOL
+    with _RENDER_POOL_LOCK:
+        pool, _RENDER_POOL = _RENDER_POOL, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def _render_pages(pdf_bytes: bytes, max_pages: int, dpi: int, image_format: str) -> List[str]:
+    """Render the first max_pages pages to base64 encoded images (runs in the render pool)"""
+    images = []
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        for page_num in range(min(max_pages, len(doc))):
+            pix = doc[page_num].get_pixmap(dpi=dpi)
+            if image_format == "jpeg":
+                # Pixels crus -> Pillow (libjpeg-turbo): bem mais rápido que o encoder JPEG do MuPDF
+                img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+                buf = io.BytesIO()
+                img.save(buf, "JPEG", quality=85, optimize=False)
+                img_bytes = buf.getvalue()
+            else:
+                img_bytes = pix.tobytes(image_format)
+            images.append(base64.b64encode(img_bytes).decode('utf-8'))
+    finally:
+        doc.close()
+    return images
+
 
 class VisionExtractor:
     """Extracts fiscal data using multimodal LLM (LLaVA) via Ollama"""
     
-    def __init__(self, model_name: str = "llava:7b", base_url: str = "http://localhost:11434"):
+    # Incrementar ao alterar _build_prompt/_pdf_to_base64_images (invalida o cache em disco)
+    PROMPT_VERSION = "3"
+    
+    def __init__(self, model_name: str = "llava:7b", base_url: str = "http://localhost:11434",
+                 image_dpi: int = 150, image_format: str = "jpeg"):
         self.model_name = model_name
         self.base_url = base_url
         self.api_url = f"{base_url}/api/generate"
         self.timeout = 120  # 120s timeout for GPU vision processing
         
+        # JPEG a 150 DPI: payload base64 bem menor que PNG a 200 DPI, sem perda de legibilidade
+        # para o LLaVA. Use image_format="png"/image_dpi=200 se precisar de qualidade de OCR.
+        self.image_dpi = image_dpi
+        self.image_format = image_format
+        
+        # Sessão persistente: reaproveita a conexão keep-alive com o Ollama entre documentos
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0))
+        
     def is_available(self) -> bool:
         """Check if Ollama is running and vision model is available"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=5)
             if response.status_code == 200:
                 models = [m['name'] for m in response.json().get('models', [])]
                 # Check for llava, bakllava, moondream
@@ -43,18 +172,68 @@ class VisionExtractor:
             return False
         return False
 
-    def extract(self, pdf_bytes: bytes, filename: str, check_cancel: Optional[Callable[[], bool]] = None) -> FiscalDocument:
+    def render_images(self, pdf_bytes: bytes) -> List[str]:
+        """
+        Render the PDF pages sent to the model (base64).
+        
+        Exposed so callers that serialize access to Ollama can render outside
+        their lock and hand the result to extract(images_b64=...).
+        """
+        return self._pdf_to_base64_images(pdf_bytes)
+
+    def _cache_key(self, pdf_bytes: bytes) -> str:
+        return llm_cache.make_key(self.model_name, self.PROMPT_VERSION, pdf_bytes)
+
+    def _images_cache_key(self, images_b64: List[str]) -> str:
+        # Chave pelo conteúdo renderizado (hash de cada página, em ordem): reemissões com
+        # bytes/metadados diferentes mas páginas visualmente idênticas reaproveitam o resultado
+        page_digests = b"".join(hashlib.sha256(img.encode("ascii")).digest() for img in images_b64)
+        return llm_cache.make_key(self.model_name, self.PROMPT_VERSION, page_digests)
+
+    def lookup_cache(self, pdf_bytes: bytes) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        (cache key, cached JSON or None) for this PDF with the current model/prompt.
+        
+        Hand both to extract(cache_key=..., cached=...) so the PDF is not hashed
+        and the cache entry is not read again.
+        """
+        cache_key = self._cache_key(pdf_bytes)
+        return cache_key, llm_cache.get(cache_key)
+
+    def extract(self, pdf_bytes: bytes, filename: str, check_cancel: Optional[Callable[[], bool]] = None,
+                images_b64: Optional[List[str]] = None, cache_key: Optional[str] = None,
+                cached: Optional[Dict[str, Any]] = None) -> FiscalDocument:
         """
         Extract data from PDF using Vision LLM.
+        
+        cache_key/cached: result of a previous lookup_cache() call; when cache_key is
+        given the lookup is not repeated.
         """
         doc = FiscalDocument(filename=filename, is_scanned=True)
         
         try:
-            # 1. Convert PDF pages to base64 images
-            images_b64 = self._pdf_to_base64_images(pdf_bytes)
+            # 0. Resultado já conhecido para este conteúdo: evita renderizar e chamar o modelo
+            if cache_key is None:
+                cache_key, cached = self.lookup_cache(pdf_bytes)
+            if cached is not None:
+                logger.info(f"Vision cache hit for {filename}")
+                self._map_json_to_doc(cached, doc)
+                return doc
+            
+            # 1. Convert PDF pages to base64 images (unless pre-rendered by the caller)
+            if images_b64 is None:
+                images_b64 = self._pdf_to_base64_images(pdf_bytes)
             
             if not images_b64:
                 raise ValueError("Could not convert PDF to images")
+            
+            images_key = self._images_cache_key(images_b64)
+            cached = llm_cache.get(images_key)
+            if cached is not None:
+                logger.info(f"Vision cache hit (rendered pages) for {filename}")
+                self._map_json_to_doc(cached, doc)
+                llm_cache.put(cache_key, cached)
+                return doc
                 
             logger.info(f"Sending {len(images_b64)} page images to {self.model_name}...")
             
@@ -69,18 +248,25 @@ class VisionExtractor:
                 return doc
 
             # 3. Call Ollama API
-            response_json = self._call_ollama(images_b64, prompt)
+            response_json = self._call_ollama(images_b64, prompt, check_cancel)
+            if response_json is None:
+                logger.info(f"Vision processing cancelled for {filename}")
+                return doc
             
             # 4. Parse response
             try:
                 # Sanitize JSON if needed (remove markdown)
-                clean_json = response_json.replace('```json', '').replace('```', '').strip()
-                data = json.loads(clean_json)
+                clean_json = (response_json.strip()
+                              .removeprefix('```json').removeprefix('```')
+                              .removesuffix('```').strip())
+                data = orjson.loads(clean_json)
                 
                 # 5. Map to FiscalDocument
                 self._map_json_to_doc(data, doc)
+                llm_cache.put(cache_key, data)
+                llm_cache.put(images_key, data)
                 
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 logger.error(f"Failed to parse LLM JSON: {e}. Response: {response_json[:200]}...")
                 doc.error_message = "Falha ao processar resposta da IA"
             
@@ -94,35 +280,30 @@ class VisionExtractor:
         """Convert PDF pages to base64 encoded images"""
         images = []
         try:
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            
-            # Limit pages to avoid context window issues
-            pages_to_process = min(max_pages, len(doc))
+            # Limit pages (max_pages) to avoid context window issues
+            pool = _get_render_pool()
+            if pool is None:
+                return _render_pages(pdf_bytes, max_pages, self.image_dpi, self.image_format)
             
-            for page_num in range(pages_to_process):
-                page = doc[page_num]
-                
-                # DPI 200 is a good balance for LLaVA (readable but not huge)
-                pix = page.get_pixmap(dpi=200) 
-                img_bytes = pix.tobytes("png")
-                b64 = base64.b64encode(img_bytes).decode('utf-8')
-                images.append(b64)
-            
-            doc.close()
+            # Uma tarefa por documento: o PDF é serializado para o pool uma única vez
+            # (o paralelismo vem dos vários arquivos do lote renderizando ao mesmo tempo)
+            images = pool.submit(_render_pages, pdf_bytes, max_pages,
+                                 self.image_dpi, self.image_format).result()
         except Exception as e:
             logger.error(f"PDF to Image conversion error: {e}")
             
         return images
 
-    def _call_ollama(self, images: List[str], prompt: str) -> str:
-        """Call Ollama generate endpoint"""
+    def _call_ollama(self, images: List[str], prompt: str,
+                     check_cancel: Optional[Callable[[], bool]] = None) -> Optional[str]:
+        """Call Ollama generate endpoint (returns None if cancelled mid-generation)"""
         # For LLaVA, we typically send images with the user message
         
         payload = {
             "model": self.model_name,
             "prompt": prompt,
             "images": images,  # Ollama accepts list of base64 images
-            "stream": False,
+            "stream": True,  # Streaming: permite cancelar durante a geração
             "format": "json",  # Enforce JSON mode
             "options": {
                 "temperature": 0.1,  # Low temperature for factual extraction
@@ -130,54 +311,38 @@ class VisionExtractor:
             }
         }
         
-        response = requests.post(self.api_url, json=payload, timeout=self.timeout)
+        # orjson: serializa o payload (imagens base64 grandes) bem mais rápido que o json do requests
+        response = self.session.post(self.api_url, data=orjson.dumps(payload),
+                                     headers={"Content-Type": "application/json"},
+                                     timeout=self.timeout, stream=True)
         
-        if response.status_code != 200:
-            raise Exception(f"Ollama API Error ({response.status_code}): {response.text}")
+        try:
+            if response.status_code != 200:
+                raise Exception(f"Ollama API Error ({response.status_code}): {response.text}")
             
-        return response.json().get('response', '')
+            # Coletar resposta em chunks, verificando cancelamento entre eles
+            parts = []
+            for line in response.iter_lines():
+                if check_cancel and check_cancel():
+                    return None
+                
+                if line:
+                    try:
+                        chunk = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        continue
+                    parts.append(chunk.get("response", ""))
+                    if chunk.get("done", False):
+                        break
+            
+            return "".join(parts)
+        finally:
+            # Fechar a conexão interrompe a geração no Ollama em caso de cancelamento
+            response.close()
 
     def _build_prompt(self) -> str:
         """Construct the extraction prompt"""
-        return """
-        Você é um especialista em extração de dados de documentos fiscais brasileiros (NF-e, NFS-e).
-        Analise a imagem deste documento e extraia os dados abaixo em formato JSON.
-        
-        REGRAS:
-        1. Responda APENAS com o JSON válido.
-        2. Se um campo não existir ou estiver ilegível, use null.
-        3. Valores monetários devem ser números (ex: 100.50).
-        4. Datas devem ser YYYY-MM-DD.
-        
-        ESTRUTURA JSON DESEJADA:
-        {
-            "tipo_documento": "NFS-e" | "NF-e",
-            "numero": "string (apenas dígitos)",
-            "serie": "string",
-            "chave_acesso": "string (44 dígitos)",
-            "data_emissao": "YYYY-MM-DD",
-            "emitente": {
-                "cnpj": "string (apenas dígitos)",
-                "razao_social": "string",
-                "endereco": "string"
-            },
-            "destinatario": {
-                "cnpj": "string (apenas dígitos)",
-                "razao_social": "string"
-            },
-            "valores": {
-                "valor_total": number,
-                "valor_servicos": number,
-                "iss": number,
-                "pis": number,
-                "cofins": number,
-                "ir": number,
-                "inss": number,
-                "csll": number,
-                "valor_liquido": number
-            }
-        }
-        """
+        return _VISION_PROMPT
 
     def _map_json_to_doc(self, data: Dict[str, Any], doc: FiscalDocument):
         """Map JSON response to FiscalDocument"""
@@ -191,7 +356,7 @@ class VisionExtractor:
             
         doc.numero = str(data.get("numero") or "")
         doc.serie = str(data.get("serie") or "")
-        doc.chave_acesso = data.get("chave_acesso")
+        doc.chave_acesso = FiscalDocument.validate_chave_acesso(data.get("chave_acesso"))
         
         # Dates
         if data.get("data_emissao"):
@@ -203,7 +368,7 @@ class VisionExtractor:
         emit = data.get("emitente", {})
         if emit:
             doc.emitente = Entity(
-                cnpj=str(emit.get("cnpj") or "").replace('.', '').replace('/', '').replace('-', ''),
+                cnpj=digits_only(str(emit.get("cnpj") or "")),
                 razao_social=emit.get("razao_social"),
                 endereco=Address(logradouro=emit.get("endereco"))
             )
@@ -212,21 +377,13 @@ class VisionExtractor:
         dest = data.get("destinatario", {})
         if dest:
             doc.destinatario = Entity(
-                cnpj=str(dest.get("cnpj") or "").replace('.', '').replace('/', '').replace('-', ''),
+                cnpj=digits_only(str(dest.get("cnpj") or "")),
                 razao_social=dest.get("razao_social")
             )
             
         # Values
         vals = data.get("valores", {})
         if vals:
-            doc.valores = TaxValues(
-                valor_total=vals.get("valor_total"),
-                valor_servicos=vals.get("valor_servicos"),
-                iss=vals.get("iss"),
-                pis=vals.get("pis"),
-                cofins=vals.get("cofins"),
-                inss=vals.get("inss"),
-                ir=vals.get("ir"),
-                csll=vals.get("csll"),
-                valor_liquido=vals.get("valor_liquido")
-            )
+            doc.valores = TaxValues(**{
+                field: vals[key] for key, field in _VALORES_FIELDS if vals.get(key) is not None
+            })
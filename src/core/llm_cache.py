@@ -0,0 +1,76 @@
+"""
+Cache em disco para respostas de extração via IA local (Ollama).
+
+A chave é o SHA-256 de (modelo, versão do prompt, conteúdo do documento), então
+reprocessar o mesmo PDF/texto com o mesmo modelo não chama o LLM novamente.
+Cada entrada é um JSON em data/llm_cache/<hash>.json, ao lado do projeto ou do
+executável (build PyInstaller).
+"""
+import hashlib
+import orjson
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any
+from loguru import logger
+
+
+def _default_cache_dir() -> Path:
+    """data/llm_cache next to the executable (frozen build) or the project root."""
+    if getattr(sys, "frozen", False):
+        # PyInstaller: __file__ fica no _MEIPASS temporário, apagado a cada execução
+        base = Path(sys.executable).resolve().parent
+    else:
+        base = Path(__file__).resolve().parent.parent.parent
+    return base / "data" / "llm_cache"
+
+
+CACHE_DIR = _default_cache_dir()
+TTL_SECONDS = 7 * 24 * 3600  # 7 dias
+
+
+def make_key(model_name: str, prompt_version: str, content: bytes) -> str:
+    """Gera a chave do cache para um documento."""
+    h = hashlib.sha256()
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(prompt_version.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(content)
+    return h.hexdigest()
+
+
+def get(key: str) -> Optional[Dict[str, Any]]:
+    """Retorna o resultado em cache ou None (ausente, expirado ou inválido)."""
+    path = CACHE_DIR / f"{key}.json"
+    try:
+        if time.time() - path.stat().st_mtime > TTL_SECONDS:
+            return None
+        data = orjson.loads(path.read_bytes())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.debug(f"LLM cache read failed for {key[:12]}: {e}")
+        return None
+
+    # Validação leve: respostas do LLM são sempre objetos JSON
+    if not isinstance(data, dict) or not data:
+        return None
+    return data
+
+
+def put(key: str, data: Dict[str, Any]) -> None:
+    """Grava o resultado no cache (falhas de disco são apenas registradas)."""
+    if not isinstance(data, dict) or not data:
+        return
+    path = CACHE_DIR / f"{key}.json"
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_bytes(orjson.dumps(data))
+        # Troca atômica: leitores nunca veem um arquivo pela metade
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"LLM cache write failed for {key[:12]}: {e}")
@@ -3,13 +3,23 @@ Serviço de extração de dados usando Ollama (IA Local).
 Replica o comportamento do Gemini da versão web.
 """
 import requests
-import json
-import re
+from requests.adapters import HTTPAdapter
+import orjson
 from typing import Optional, Dict, Any
 from loguru import logger
 
+from core import llm_cache
+
 OLLAMA_URL = "http://localhost:11434/api/generate"
 MODEL_NAME = "phi3"  # Modelo rápido e eficiente
+# Incrementar ao alterar EXTRACTION_PROMPT (invalida o cache em disco)
+PROMPT_VERSION = "1"
+
+# Sessão compartilhada: mantém a conexão com o Ollama aberta entre documentos do lote
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=8, max_retries=0))
+# Corpo já serializado com orjson (mais rápido que o encoder json do requests)
+_JSON_HEADERS = {"Content-Type": "application/json"}
 
 EXTRACTION_PROMPT = """Você é um especialista em extração de dados de documentos fiscais brasileiros.
 Analise o texto abaixo e extraia as informações no formato JSON especificado.
@@ -57,11 +67,14 @@ ESTRUTURA JSON OBRIGATÓRIA:
 
 Responda APENAS com o JSON:"""
 
+# Template dividido uma vez: montar o prompt é só concatenar (sem varrer o template a cada chamada)
+_PROMPT_PREFIX, _, _PROMPT_SUFFIX = EXTRACTION_PROMPT.partition("{document_text}")
+
 
 def is_ollama_available() -> bool:
     """Verifica se o Ollama está rodando."""
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=2)
+        response = _SESSION.get("http://localhost:11434/api/tags", timeout=2)
         return response.status_code == 200
     except:
         return False
@@ -81,15 +94,22 @@ def extract_with_ollama(document_text: str, timeout: int = 120, check_cancel: ca
     """
     # Limitar texto para evitar timeout (primeiros 6000 caracteres)
     text_truncated = document_text[:6000]
-    prompt = EXTRACTION_PROMPT.replace("{document_text}", text_truncated)
+    # Mesmo texto + mesmo modelo/prompt => mesma resposta: reutilizar do cache
+    cache_key = llm_cache.make_key(MODEL_NAME, PROMPT_VERSION, text_truncated.encode("utf-8"))
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Resultado do Ollama reaproveitado do cache")
+        return cached
+    
+    prompt = _PROMPT_PREFIX + text_truncated + _PROMPT_SUFFIX
     
     try:
         logger.info(f"Enviando para Ollama ({MODEL_NAME})...")
         
         # Usar streaming para permitir cancelamento durante a geração
-        response = requests.post(
+        response = _SESSION.post(
             OLLAMA_URL,
-            json={
+            data=orjson.dumps({
                 "model": MODEL_NAME,
                 "prompt": prompt,
                 "stream": True,  # Habilitar streaming para cancelamento
@@ -97,7 +117,8 @@ def extract_with_ollama(document_text: str, timeout: int = 120, check_cancel: ca
                     "temperature": 0.1,
                     "num_predict": 1000
                 }
-            },
+            }),
+            headers=_JSON_HEADERS,
             timeout=timeout,
             stream=True
         )
@@ -116,13 +137,13 @@ def extract_with_ollama(document_text: str, timeout: int = 120, check_cancel: ca
             
             if line:
                 try:
-                    chunk = json.loads(line)
+                    chunk = orjson.loads(line)
                     result_text += chunk.get("response", "")
                     
                     # Se finalizado, sair do loop
                     if chunk.get("done", False):
                         break
-                except json.JSONDecodeError:
+                except orjson.JSONDecodeError:
                     continue
         
         logger.debug(f"Resposta bruta do Ollama: {result_text[:500]}...")
@@ -132,6 +153,7 @@ def extract_with_ollama(document_text: str, timeout: int = 120, check_cancel: ca
         
         if json_data:
             logger.info("Extração via Ollama concluída com sucesso!")
+            llm_cache.put(cache_key, json_data)
             return json_data
         else:
             logger.warning("Não foi possível parsear JSON da resposta do Ollama")
@@ -157,16 +179,17 @@ def _parse_json_from_response(response_text: str) -> Optional[Dict[str, Any]]:
         if len(parts) >= 2:
             text = parts[1]
     
-    # Tentar encontrar JSON com regex
-    json_match = re.search(r'\{[\s\S]*\}', text)
-    if json_match:
+    # Do primeiro '{' ao último '}' (mesmo trecho que a regex gulosa \{[\s\S]*\} capturava)
+    start = text.find('{')
+    end = text.rfind('}')
+    if start != -1 and end > start:
         try:
-            return json.loads(json_match.group())
-        except json.JSONDecodeError:
+            return orjson.loads(text[start:end + 1])
+        except orjson.JSONDecodeError:
             pass
     
     # Tentar parsear diretamente
     try:
-        return json.loads(text)
-    except json.JSONDecodeError:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
         return None
@@ -1,9 +1,12 @@
 """
 Processing orchestrator - manages concurrent file processing.
 """
-from typing import List, Tuple, Callable, Optional
-from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from typing import Dict, List, Tuple, Callable, Optional
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, FIRST_COMPLETED, wait
 from pathlib import Path
+import hashlib
+import multiprocessing
 import threading
 from loguru import logger
 
@@ -19,6 +22,63 @@ from utils import FileHandler
 from core.extractor import HybridExtractor
 
 
+# Estado de cada processo do pool (modo use_processes)
+_worker_extractor: Optional[HybridExtractor] = None
+_worker_cancel = None
+
+
+def _init_worker(extractor_kwargs: dict, cancel_event, vision_lock) -> None:
+    """Cria um HybridExtractor próprio em cada processo do pool."""
+    global _worker_extractor, _worker_cancel
+    # vision_lock compartilhado: chamadas Vision/Ollama continuam serializadas entre os processos
+    _worker_extractor = HybridExtractor(**extractor_kwargs, vision_lock=vision_lock)
+    _worker_cancel = cancel_event
+
+
+def _extract_in_worker(filename: str, pdf_bytes: bytes) -> ProcessingResult:
+    """Executado no processo filho: extrai um PDF e devolve o resultado (picklable)."""
+    if _worker_cancel.is_set():
+        return ProcessingResult(filename=filename, status=ProcessingStatus.CANCELLED)
+    
+    document, processing_time = _worker_extractor.extract(pdf_bytes, filename, check_cancel=_worker_cancel.is_set)
+    
+    if _worker_cancel.is_set():
+        return ProcessingResult(filename=filename, status=ProcessingStatus.CANCELLED)
+    
+    return _build_result(filename, document, processing_time)
+
+
+def _build_result(filename: str, document: FiscalDocument, processing_time: float) -> ProcessingResult:
+    """Monta o ProcessingResult de um documento extraído."""
+    result = ProcessingResult(
+        filename=filename,
+        status=document.processing_status,
+        document=document,
+        processing_time_seconds=processing_time
+    )
+    
+    if document.error_message:
+        result.error = ProcessingError(
+            filename=filename,
+            error_type="ExtractionError",
+            error_message=document.error_message
+        )
+    
+    return result
+
+
+def _alias_result(result: ProcessingResult, filename: str, source_path: str) -> ProcessingResult:
+    """Cópia do resultado de um PDF duplicado, apontando para outro nome de arquivo."""
+    alias = result.model_copy(deep=True)
+    alias.filename = filename
+    alias.source_path = source_path
+    if alias.document:
+        alias.document.filename = filename
+    if alias.error:
+        alias.error.filename = filename
+    return alias
+
+
 class ProcessingOrchestrator:
     """
     Orchestrates concurrent processing of fiscal documents.
@@ -28,7 +88,9 @@ class ProcessingOrchestrator:
     def __init__(self,
                  extractor: HybridExtractor,
                  max_workers: int = 3,
-                 progress_callback: Optional[Callable[[ProgressUpdate], None]] = None):
+                 progress_callback: Optional[Callable[[ProgressUpdate], None]] = None,
+                 use_processes: bool = False,
+                 result_callback: Optional[Callable[[ProcessingResult], None]] = None):
         """
         Initialize orchestrator.
         
@@ -36,14 +98,22 @@ class ProcessingOrchestrator:
             extractor: Hybrid extractor instance
             max_workers: Maximum concurrent processing tasks
             progress_callback: Optional callback for progress updates
+            use_processes: Run extractions in a process pool (CPU-bound OCR/rendering
+                           escapes the GIL). Each process builds its own extractor.
+            result_callback: Optional callback receiving each ProcessingResult as soon as
+                             it is collected (runs on the thread calling process_files)
         """
         self.extractor = extractor
         self.max_workers = max_workers
         self.progress_callback = progress_callback
+        self.use_processes = use_processes
+        self.result_callback = result_callback
         
         # Cancellation flag
         self._cancel_flag = threading.Event()
         self._lock = threading.Lock()
+        # Espelho do cancelamento visível pelos processos filhos (modo use_processes)
+        self._mp_cancel_flag = None
     
     def process_files(self, file_paths: List[Path]) -> BatchProcessingResult:
         """
@@ -69,22 +139,61 @@ class ProcessingOrchestrator:
         # Initialize batch result
         batch_result = BatchProcessingResult(total_files=len(pdf_files))
         
-        logger.info(f"Starting concurrent processing of {len(pdf_files)} PDFs (max workers: {self.max_workers})")
+        # PDFs idênticos (ex.: mesmo arquivo repetido em ZIPs) são processados uma única vez;
+        # o resultado é replicado para os demais nomes
+        digest_map: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+        unique_files: List[Tuple[str, str, str, bytes]] = []
+        for filename, pdf_bytes, source_path in pdf_files:
+            digest = hashlib.sha256(pdf_bytes).hexdigest()
+            if not digest_map[digest]:
+                unique_files.append((digest, filename, source_path, pdf_bytes))
+            digest_map[digest].append((filename, source_path))
+        
+        if len(unique_files) < len(pdf_files):
+            logger.info(f"{len(pdf_files) - len(unique_files)} duplicate PDFs will reuse earlier results")
+        
+        logger.info(f"Starting concurrent processing of {len(unique_files)} PDFs (max workers: {self.max_workers})")
+        
+        # Progresso contado sobre todos os arquivos (duplicados inclusive), como total_files
+        total = len(pdf_files)
         
         # Process files concurrently
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # Submit all tasks
+        with self._create_executor() as executor:
+            # Submissão em janela: no máximo 2x max_workers tarefas em voo; a próxima só entra
+            # quando outra termina (cancelamento não deixa fila de futures para trás e, no modo
+            # use_processes, limita as cópias serializadas dos PDFs na fila do pool).
+            # Não limita a memória dos PDFs em si: prepare_files_for_processing já leu todos.
+            window = self.max_workers * 2
+            pending = iter(enumerate(unique_files))
             future_to_file = {}
-            for idx, (filename, pdf_bytes) in enumerate(pdf_files):
-                if self._cancel_flag.is_set():
-                    logger.info("Processing cancelled before submission")
+            future_to_digest = {}
+            completed = 0
+            
+            while True:
+                while len(future_to_file) < window:
+                    if self._cancel_flag.is_set():
+                        logger.info("Processing cancelled before submission")
+                        break
+                    
+                    item = next(pending, None)
+                    if item is None:
+                        break
+                    idx, (digest, filename, source_path, pdf_bytes) = item
+                    
+                    if self.use_processes:
+                        future = executor.submit(_extract_in_worker, filename, pdf_bytes)
+                    else:
+                        future = executor.submit(self._process_single_file, filename, pdf_bytes, idx,
+                                                 total, source_path)
+                    future_to_file[future] = (filename, source_path)
+                    future_to_digest[future] = digest
+                
+                if not future_to_file:
                     break
                 
-                future = executor.submit(self._process_single_file, filename, pdf_bytes, idx, len(pdf_files))
-                future_to_file[future] = filename
-            
-            # Collect results as they complete
-            for future in as_completed(future_to_file):
+                # Collect results as they complete
+                done, _ = wait(future_to_file, return_when=FIRST_COMPLETED)
+                
                 if self._cancel_flag.is_set():
                     logger.info("Processing cancelled, skipping remaining results")
                     # Cancel pending futures
@@ -92,24 +201,48 @@ class ProcessingOrchestrator:
                         f.cancel()
                     break
                 
-                filename = future_to_file[future]
-                
-                try:
-                    result = future.result()
-                    batch_result.add_result(result)
+                for future in done:
+                    filename, source_path = future_to_file.pop(future)
+                    digest = future_to_digest.pop(future)
                     
-                except Exception as e:
-                    logger.error(f"Unexpected error processing {filename}: {e}")
-                    error_result = ProcessingResult(
-                        filename=filename,
-                        status=ProcessingStatus.ERROR,
-                        error=ProcessingError(
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f"Unexpected error processing {filename}: {e}")
+                        result = ProcessingResult(
                             filename=filename,
-                            error_type=type(e).__name__,
-                            error_message=str(e)
+                            status=ProcessingStatus.ERROR,
+                            error=ProcessingError(
+                                filename=filename,
+                                error_type=type(e).__name__,
+                                error_message=str(e)
+                            )
+                        )
+                    
+                    result.source_path = source_path
+                    collected = [result] + [
+                        _alias_result(result, alias, alias_source)
+                        for alias, alias_source in digest_map[digest][1:]
+                    ]
+                    
+                    # Conclusão enviada na coleta (um evento por arquivo, duplicados inclusive):
+                    # nos dois modos o índice é a contagem de resultados já coletados
+                    for item_result in collected:
+                        completed += 1
+                        self._send_progress(
+                            filename=item_result.filename,
+                            index=completed,
+                            total=total,
+                            status=item_result.status,
+                            message=f"Concluído: {item_result.filename}",
+                            source_path=item_result.source_path
                         )
-                    )
-                    batch_result.add_result(error_result)
+                        self._collect(batch_result, item_result)
+        
+        # Processos de renderização do vision não ficam vivos entre lotes
+        if self.extractor.vision_extractor is not None:
+            from core.extractor_vision import shutdown_render_pool
+            shutdown_render_pool()
         
         # Finalize batch
         batch_result.finalize()
@@ -120,11 +253,37 @@ class ProcessingOrchestrator:
         
         return batch_result
     
+    def _collect(self, batch_result: BatchProcessingResult, result: ProcessingResult):
+        """Add a result to the batch and hand it to result_callback"""
+        batch_result.add_result(result)
+        if self.result_callback:
+            try:
+                self.result_callback(result)
+            except Exception as e:
+                logger.error(f"Error in result callback: {e}")
+    
+    def _create_executor(self):
+        """Thread pool (default) or spawn-based process pool."""
+        if not self.use_processes:
+            return ThreadPoolExecutor(max_workers=self.max_workers)
+        
+        # spawn: fork com threads/sessões HTTP abertas pode travar o processo filho
+        ctx = multiprocessing.get_context("spawn")
+        self._mp_cancel_flag = ctx.Event()
+        # Criado a cada lote: os workers refletem o estado atual do extractor (ex.: IA ligada/desligada na UI)
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(self.extractor.worker_kwargs(), self._mp_cancel_flag, ctx.Lock())
+        )
+    
     def _process_single_file(self, 
                             filename: str, 
                             pdf_bytes: bytes,
                             index: int,
-                            total: int) -> ProcessingResult:
+                            total: int,
+                            source_path: Optional[str] = None) -> ProcessingResult:
         """
         Process a single PDF file.
         
@@ -133,6 +292,7 @@ class ProcessingOrchestrator:
             pdf_bytes: PDF content bytes
             index: Current file index
             total: Total number of files
+            source_path: Selected file the PDF came from (forwarded in progress updates)
         
         Returns:
             ProcessingResult
@@ -151,7 +311,8 @@ class ProcessingOrchestrator:
             index=index,
             total=total,
             status=ProcessingStatus.PROCESSING,
-            message=f"Processando {filename}..."
+            message=f"Processando {filename}...",
+            source_path=source_path
         )
         
         try:
@@ -166,31 +327,8 @@ class ProcessingOrchestrator:
                     status=ProcessingStatus.CANCELLED
                 )
             
-            # Create result
-            result = ProcessingResult(
-                filename=filename,
-                status=document.processing_status,
-                document=document,
-                processing_time_seconds=processing_time
-            )
-            
-            if document.error_message:
-                result.error = ProcessingError(
-                    filename=filename,
-                    error_type="ExtractionError",
-                    error_message=document.error_message
-                )
-            
-            # Send completion update
-            self._send_progress(
-                filename=filename,
-                index=index + 1,
-                total=total,
-                status=document.processing_status,
-                message=f"Concluído: {filename}"
-            )
-            
-            return result
+            # Completion update is sent by process_files when the result is collected
+            return _build_result(filename, document, processing_time)
         
         except Exception as e:
             logger.error(f"Error processing {filename}: {e}", exc_info=True)
@@ -209,6 +347,8 @@ class ProcessingOrchestrator:
         """Cancel ongoing processing"""
         logger.warning("Cancellation requested")
         self._cancel_flag.set()
+        if self._mp_cancel_flag is not None:
+            self._mp_cancel_flag.set()
     
     def is_cancelled(self) -> bool:
         """Check if processing is cancelled"""
@@ -219,7 +359,8 @@ class ProcessingOrchestrator:
                       index: int,
                       total: int,
                       status: ProcessingStatus,
-                      message: str):
+                      message: str,
+                      source_path: Optional[str] = None):
         """Send progress update via callback"""
         if self.progress_callback:
             update = ProgressUpdate(
@@ -227,7 +368,8 @@ class ProcessingOrchestrator:
                 current_index=index,
                 total_files=total,
                 status=status,
-                message=message
+                message=message,
+                source_path=source_path
             )
             
             try:
@@ -1,6 +1,7 @@
 """
 Main entry point for the Fiscal Document Extractor application.
 """
+import multiprocessing
 import sys
 from pathlib import Path
 import flet as ft
@@ -67,6 +68,7 @@ def main(page: ft.Page):
     orchestrator = ProcessingOrchestrator(
         extractor=extractor,
         max_workers=settings.processing.max_concurrent_files,
+        use_processes=settings.processing.use_processes,
     )
     
     excel_reporter = ExcelReporter(output_dir=output_dir)
@@ -84,6 +86,8 @@ def main(page: ft.Page):
 
 
 if __name__ == "__main__":
+    # Necessário para o pool de processos (spawn) no executável PyInstaller
+    multiprocessing.freeze_support()
     try:
         ft.app(target=main)
     except Exception as e:
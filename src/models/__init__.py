@@ -8,7 +8,8 @@ from .document import (
     Entity,
     Address,
     TaxValues,
-    ServiceItem
+    ServiceItem,
+    digits_only
 )
 from .config import (
     Settings,
@@ -20,7 +21,8 @@ from .results import (
     ProcessingResult,
     ProcessingError,
     BatchProcessingResult,
-    ProgressUpdate
+    ProgressUpdate,
+    SourceStatusTracker
 )
 
 __all__ = [
@@ -32,6 +34,7 @@ __all__ = [
     "Address",
     "TaxValues",
     "ServiceItem",
+    "digits_only",
     # Configuration
     "Settings",
     "CNPJMapper",
@@ -42,4 +45,5 @@ __all__ = [
     "ProcessingError",
     "BatchProcessingResult",
     "ProgressUpdate",
+    "SourceStatusTracker",
 ]
@@ -1,14 +1,25 @@
 """
 Configuration models and loaders.
 """
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 from pathlib import Path
+from functools import lru_cache
+import os
 from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings
-import tomli
-import json
+import tomllib
+import orjson
 from loguru import logger
 
+from .document import digits_only
+
+
+@lru_cache(maxsize=8)
+def _read_toml(path: str, mtime_ns: int) -> dict:
+    """Parsed TOML of a file; mtime_ns is part of the key, so editing the file invalidates it"""
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
 
 class AppConfig(BaseModel):
     """Application configuration"""
@@ -22,6 +33,7 @@ class ProcessingConfig(BaseModel):
     max_concurrent_files: int = Field(3, ge=1, le=10)
     pdf_page_limit: int = Field(0, ge=0)
     min_text_length: int = Field(50, ge=10)
+    use_processes: bool = False
 
 
 class PerformanceConfig(BaseModel):
@@ -65,8 +77,8 @@ class Settings(BaseModel):
     def load_from_toml(cls, config_path: Path) -> "Settings":
         """Load settings from TOML file"""
         try:
-            with open(config_path, "rb") as f:
-                data = tomli.load(f)
+            # Um stat por chamada; o parse só se repete se o arquivo mudou
+            data = _read_toml(str(config_path), os.stat(config_path).st_mtime_ns)
             return cls(**data)
         except Exception as e:
             logger.warning(f"Failed to load config from {config_path}: {e}. Using defaults.")
@@ -85,21 +97,26 @@ class CNPJMapper:
     
     def __init__(self, mapping_path: Path):
         self.mapping_path = mapping_path
+        # Entradas cruas do JSON (chave normalizada); o FilialMapping só é criado no
+        # primeiro lookup daquele CNPJ e fica em self.mappings
+        self._raw: Dict[str, dict] = {}
         self.mappings: Dict[str, FilialMapping] = {}
+        # Último lookup (CNPJ, resultado): lotes costumam repetir o mesmo tomador em sequência.
+        # Tupla única para que threads concorrentes nunca vejam chave e valor de lookups diferentes
+        self._last: Tuple[Optional[str], Optional[FilialMapping]] = (None, None)
         self.load_mappings()
     
     def load_mappings(self):
         """Load CNPJ mappings from JSON file"""
         try:
-            with open(self.mapping_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            with open(self.mapping_path, "rb") as f:
+                data = orjson.loads(f.read())
             
             for cnpj, info in data.items():
                 # Normalize CNPJ (remove formatting)
-                cnpj_normalized = self._normalize_cnpj(cnpj)
-                self.mappings[cnpj_normalized] = FilialMapping(**info)
+                self._raw[self._normalize_cnpj(cnpj)] = info
             
-            logger.info(f"Loaded {len(self.mappings)} CNPJ mappings")
+            logger.info(f"Loaded {len(self._raw)} CNPJ mappings")
         except Exception as e:
             logger.error(f"Failed to load CNPJ mappings from {self.mapping_path}: {e}")
     
@@ -111,19 +128,41 @@ class CNPJMapper:
         if not cnpj:
             return None
         
-        cnpj_normalized = self._normalize_cnpj(cnpj)
-        mapping = self.mappings.get(cnpj_normalized)
+        last_cnpj, last_mapping = self._last
+        if cnpj == last_cnpj:
+            return last_mapping
+        
+        # Caminho rápido: Entity.cnpj já chega só com dígitos (validate_cnpj)
+        mapping = self._resolve(cnpj)
+        if mapping is None:
+            mapping = self._resolve(self._normalize_cnpj(cnpj))
         
         if not mapping:
-            logger.warning(f"CNPJ not found in mappings: {cnpj}")
+            # debug: chamado por documento; CNPJ fora do mapeamento é um caso comum
+            logger.debug("CNPJ not found in mappings: {}", cnpj)
         
+        self._last = (cnpj, mapping)
+        return mapping
+    
+    def _resolve(self, cnpj_normalized: str) -> Optional[FilialMapping]:
+        """Get (building on first use) the mapping for a normalized CNPJ."""
+        mapping = self.mappings.get(cnpj_normalized)
+        if mapping is not None:
+            return mapping
+        # Sem pop: o mapper é compartilhado pelas threads do orchestrator; duas threads
+        # montando a mesma entrada ao mesmo tempo só gravam objetos equivalentes
+        info = self._raw.get(cnpj_normalized)
+        if info is not None:
+            try:
+                mapping = self.mappings[cnpj_normalized] = FilialMapping(**info)
+            except Exception as e:
+                logger.error(f"Invalid CNPJ mapping for {cnpj_normalized} in {self.mapping_path}: {e}")
         return mapping
     
     @staticmethod
     def _normalize_cnpj(cnpj: str) -> str:
         """Remove all non-numeric characters from CNPJ"""
-        import re
-        return re.sub(r'\D', '', cnpj)
+        return digits_only(cnpj)
 
 
 class EnvironmentSettings(BaseSettings):
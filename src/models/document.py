@@ -1,6 +1,7 @@
 """
 Data models for fiscal documents and their components.
 """
+from dataclasses import dataclass
 from datetime import date, datetime
 from typing import Optional, List
 from enum import Enum
@@ -8,6 +9,20 @@ from pydantic import BaseModel, Field, field_validator
 import re
 
 
+_NON_DIGIT = re.compile(r'\D')
+# Remove todos os caracteres Latin-1 que não são dígitos (caminho rápido em C)
+_DIGIT_KEEP_TABLE = str.maketrans('', '', ''.join(chr(c) for c in range(256) if not chr(c).isdigit()))
+
+
+def digits_only(s: str) -> str:
+    """Keep only the digits of s (same result as _NON_DIGIT.sub('', s))."""
+    out = s.translate(_DIGIT_KEEP_TABLE)
+    if out.isascii():
+        return out
+    # Sobrou algum caractere fora do Latin-1 (ex.: travessão Unicode): usar a regex
+    return _NON_DIGIT.sub('', s)
+
+
 class DocumentType(str, Enum):
     """Type of fiscal document"""
     NFE = "NF-e"  # Nota Fiscal Eletrônica
@@ -24,7 +39,11 @@ class ProcessingStatus(str, Enum):
     CANCELLED = "Cancelado"
 
 
-class Address(BaseModel):
+# Address e ServiceItem: objetos de valor montados pelos extratores, sem validadores.
+# Dataclasses com __slots__ evitam o custo do pydantic por instância; o pydantic aceita
+# instâncias delas nos campos de Entity/FiscalDocument sem revalidar.
+@dataclass(slots=True)
+class Address:
     """Address information"""
     logradouro: Optional[str] = None
     numero: Optional[str] = None
@@ -36,20 +55,14 @@ class Address(BaseModel):
 
     def to_string(self) -> str:
         """Convert address to formatted string"""
-        parts = []
-        if self.logradouro:
-            parts.append(self.logradouro)
-        if self.numero:
-            parts.append(f"nº {self.numero}")
-        if self.complemento:
-            parts.append(self.complemento)
-        if self.bairro:
-            parts.append(self.bairro)
-        if self.municipio and self.uf:
-            parts.append(f"{self.municipio}/{self.uf}")
-        if self.cep:
-            parts.append(f"CEP: {self.cep}")
-        return ", ".join(parts) if parts else ""
+        return ", ".join(p for p in (
+            self.logradouro,
+            f"nº {self.numero}" if self.numero else None,
+            self.complemento,
+            self.bairro,
+            f"{self.municipio}/{self.uf}" if self.municipio and self.uf else None,
+            f"CEP: {self.cep}" if self.cep else None,
+        ) if p)
 
 
 class Entity(BaseModel):
@@ -59,10 +72,10 @@ class Entity(BaseModel):
     nome_fantasia: Optional[str] = None
     inscricao_estadual: Optional[str] = None
     inscricao_municipal: Optional[str] = None
-    inscricao_municipal: Optional[str] = None
     endereco: Optional[Address] = None
     
-    model_config = {"validate_assignment": True} 
+    # Sem validate_assignment: a validação roda só na construção. Quem atribui um CNPJ
+    # ainda não normalizado deve passar por Entity.validate_cnpj(...)
 
     @field_validator('cnpj')
     @classmethod
@@ -71,7 +84,7 @@ class Entity(BaseModel):
         if v is None:
             return v
         # Remove non-numeric characters
-        cnpj_clean = re.sub(r'\D', '', v)
+        cnpj_clean = digits_only(v)
         if len(cnpj_clean) == 14:
             # User request: "Emitente/Destinatário CNPJ/CPF não devem ter ., /, -. E devem considerar o 0"
             # Return clean digits only. Excel will treat as string if we want leading zero, or we ensure reporter handles it.
@@ -110,7 +123,8 @@ class TaxValues(BaseModel):
     outras_retencoes: Optional[float] = Field(None, description="Other retentions")
 
 
-class ServiceItem(BaseModel):
+@dataclass(slots=True)
+class ServiceItem:
     """Individual service or product item"""
     item_numero: Optional[int] = None
     codigo: Optional[str] = None
@@ -137,7 +151,6 @@ class FiscalDocument(BaseModel):
     serie: Optional[str] = None
     chave_acesso: Optional[str] = None
     data_emissao: Optional[date] = None
-    data_emissao: Optional[date] = None
     data_saida_entrada: Optional[date] = None
     data_competencia: Optional[date] = None
     
@@ -160,7 +173,8 @@ class FiscalDocument(BaseModel):
     processing_time_seconds: Optional[float] = None
     processed_at: Optional[datetime] = None
 
-    model_config = {"validate_assignment": True}
+    # Sem validate_assignment (os extratores preenchem campo a campo): chaves vindas
+    # de fontes externas devem passar por FiscalDocument.validate_chave_acesso(...)
 
     @field_validator('chave_acesso')
     @classmethod
@@ -169,7 +183,7 @@ class FiscalDocument(BaseModel):
         if v is None:
             return v
         # Remove non-numeric characters
-        chave_clean = re.sub(r'\D', '', v)
+        chave_clean = digits_only(v)
         # NFe access key should have 44 digits
         if len(chave_clean) == 44:
             return chave_clean
@@ -180,8 +194,7 @@ class FiscalDocument(BaseModel):
         Get the CNPJ to use for mapping lookup.
         Priority: destinatario > emitente
         """
-        if self.destinatario and self.destinatario.cnpj:
-            return self.destinatario.cnpj
-        if self.emitente and self.emitente.cnpj:
-            return self.emitente.cnpj
+        for entity in (self.destinatario, self.emitente):
+            if entity and entity.cnpj:
+                return entity.cnpj
         return None
@@ -1,9 +1,11 @@
 """
 Models for processing results and errors.
 """
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
-from pydantic import BaseModel, Field
+import sys
+import time
+from pydantic import BaseModel, Field, PrivateAttr, field_validator
 from .document import FiscalDocument, ProcessingStatus
 
 
@@ -14,6 +16,12 @@ class ProcessingError(BaseModel):
     error_message: str
     timestamp: datetime = Field(default_factory=datetime.now)
     traceback: Optional[str] = None
+    
+    @field_validator('traceback')
+    @classmethod
+    def intern_traceback(cls, v: Optional[str]) -> Optional[str]:
+        """Share one copy of identical tracebacks (batches often fail the same way)"""
+        return sys.intern(v) if v else v
 
 
 class ProcessingResult(BaseModel):
@@ -23,6 +31,7 @@ class ProcessingResult(BaseModel):
     document: Optional[FiscalDocument] = None
     error: Optional[ProcessingError] = None
     processing_time_seconds: float = 0.0
+    source_path: Optional[str] = None  # Arquivo selecionado de origem (PDF ou ZIP)
 
 
 class BatchProcessingResult(BaseModel):
@@ -38,11 +47,15 @@ class BatchProcessingResult(BaseModel):
     start_time: datetime = Field(default_factory=datetime.now)
     end_time: Optional[datetime] = None
     
+    # Relógio monotônico para a duração (datetimes acima ficam só para exibição/log)
+    _start_monotonic: float = PrivateAttr(default_factory=time.monotonic)
+    _end_monotonic: Optional[float] = PrivateAttr(default=None)
+    
     @property
     def total_time_seconds(self) -> float:
         """Calculate total processing time"""
-        if self.end_time:
-            return (self.end_time - self.start_time).total_seconds()
+        if self._end_monotonic is not None:
+            return self._end_monotonic - self._start_monotonic
         return 0.0
     
     @property
@@ -56,17 +69,20 @@ class BatchProcessingResult(BaseModel):
         """Add a processing result and update counters"""
         self.results.append(result)
         
-        if result.status == ProcessingStatus.COMPLETED:
+        # Membros de Enum são singletons (o pydantic converte o status para o membro)
+        status = result.status
+        if status is ProcessingStatus.COMPLETED:
             self.successful += 1
-        elif result.status == ProcessingStatus.ERROR:
+        elif status is ProcessingStatus.ERROR:
             self.failed += 1
             if result.error:
                 self.errors.append(result.error)
-        elif result.status == ProcessingStatus.CANCELLED:
+        elif status is ProcessingStatus.CANCELLED:
             self.cancelled += 1
     
     def finalize(self):
         """Mark batch processing as complete"""
+        self._end_monotonic = time.monotonic()
         self.end_time = datetime.now()
 
 
@@ -77,6 +93,7 @@ class ProgressUpdate(BaseModel):
     total_files: int
     status: ProcessingStatus
     message: str
+    source_path: Optional[str] = None  # Arquivo selecionado de origem (PDF ou ZIP)
     
     @property
     def progress_percentage(self) -> float:
@@ -84,3 +101,34 @@ class ProgressUpdate(BaseModel):
         if self.total_files == 0:
             return 0.0
         return (self.current_index / self.total_files) * 100
+
+
+# Prioridade ao combinar os status dos PDFs de um mesmo arquivo selecionado (um ZIP é uma
+# linha só na UI): um PDF ainda em processamento mantém a linha "Processando"; entre os
+# status finais, erro prevalece sobre cancelamento, que prevalece sobre conclusão
+_STATUS_PRIORITY = {
+    ProcessingStatus.PENDING: 0,
+    ProcessingStatus.COMPLETED: 1,
+    ProcessingStatus.CANCELLED: 2,
+    ProcessingStatus.ERROR: 3,
+    ProcessingStatus.PROCESSING: 4,
+}
+
+
+def combine_statuses(statuses: Iterable[Tuple[ProcessingStatus, str]]) -> Tuple[ProcessingStatus, str]:
+    """(status, message) of highest priority among the PDFs of one selected file"""
+    return max(statuses, key=lambda item: _STATUS_PRIORITY[item[0]])
+
+
+class SourceStatusTracker:
+    """Último status de cada PDF, agrupado pelo arquivo selecionado de origem (source_path)"""
+    
+    def __init__(self):
+        self._by_source: Dict[Optional[str], Dict[str, Tuple[ProcessingStatus, str]]] = {}
+    
+    def update(self, source_path: Optional[str], filename: str, status: ProcessingStatus,
+               message: str = "") -> Tuple[ProcessingStatus, str]:
+        """Record one PDF's status and return the combined status for its source_path"""
+        files = self._by_source.setdefault(source_path, {})
+        files[filename] = (status, message)
+        return combine_statuses(files.values())
@@ -3,12 +3,13 @@ Main Flet UI application with Dashboard Layout.
 """
 import flet as ft
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from loguru import logger
+import asyncio
 import threading
 import os
 
-from models import ProgressUpdate, ProcessingStatus, BatchProcessingResult
+from models import ProgressUpdate, ProcessingStatus, BatchProcessingResult, SourceStatusTracker
 from core import ProcessingOrchestrator
 from utils import ExcelReporter
 
@@ -21,21 +22,47 @@ class Colors:
     BACKGROUND = "#0f172a" 
     CARD_BG = "#1e293b"
 
+# Extensões aceitas pelo seletor de arquivos
+_ALLOWED_EXT = ["pdf", "zip"]
+
+# Estilo compartilhado por todas as linhas da lista de arquivos
+_FILE_ITEM_MARGIN = ft.margin.only(bottom=5)
+_FILE_ITEM_PADDING = 10
+
+# Ícone do tipo de arquivo por extensão (pdf ou zip)
+_FILE_TYPE_ICON = {
+    ".pdf": ("picture_as_pdf", Colors.SECONDARY),
+    ".zip": ("folder_zip", Colors.SECONDARY),
+}
+
+# Ícone e cor exibidos para cada status de processamento
+_STATUS_ICON = {
+    ProcessingStatus.PENDING:    ("access_time", "grey"),
+    ProcessingStatus.PROCESSING: ("loop", Colors.PRIMARY),
+    ProcessingStatus.COMPLETED:  ("check_circle", Colors.SUCCESS),
+    ProcessingStatus.ERROR:      ("error_outline", Colors.ERROR),
+    ProcessingStatus.CANCELLED:  ("error_outline", Colors.ERROR),
+}
+
 class FileItemControl(ft.Container):
     """Custom control to display a file item in the list"""
-    def __init__(self, file_path: Path, remove_callback):
+    def __init__(self, file_path: Path, remove_callback, size_bytes: Optional[int] = None):
         super().__init__()
         self.file_path = file_path
         self.remove_callback = remove_callback
         
+        # Último status aplicado: ticks repetidos do mesmo status não geram update()
+        self._last_status: Optional[ProcessingStatus] = None
+        self._last_message: str = ""
+        
         self.icon_status = ft.Icon(name="access_time", color="grey", tooltip="Pendente")
         self.text_name = ft.Text(file_path.name, weight=ft.FontWeight.BOLD)
-        self.text_size = ft.Text(self._get_file_size_str(), size=12, color="grey")
+        self.text_size = ft.Text(self._get_file_size_str(size_bytes), size=12, color="grey")
         
+        type_icon, type_color = _FILE_TYPE_ICON.get(file_path.suffix.lower(), _FILE_TYPE_ICON[".zip"])
         self.content = ft.Row(
             [
-                ft.Icon(name="picture_as_pdf" if file_path.suffix.lower() == '.pdf' else "folder_zip", 
-                       color=Colors.SECONDARY),
+                ft.Icon(name=type_icon, color=type_color),
                 ft.Column(
                     [
                         self.text_name,
@@ -54,39 +81,44 @@ class FileItemControl(ft.Container):
             ],
             alignment=ft.MainAxisAlignment.START,
         )
-        self.padding = 10
+        self.padding = _FILE_ITEM_PADDING
         self.bgcolor = Colors.CARD_BG
         self.border_radius = 8
-        self.margin = ft.margin.only(bottom=5)
-
-    def _get_file_size_str(self):
-        try:
-            size_bytes = self.file_path.stat().st_size
-            if size_bytes < 1024:
-                return f"{size_bytes} B"
-            elif size_bytes < 1024 * 1024:
-                return f"{size_bytes / 1024:.1f} KB"
-            else:
-                return f"{size_bytes / (1024 * 1024):.1f} MB"
-        except:
-            return "Unknown size"
-
-    def set_status(self, status: ProcessingStatus, message: str = ""):
-        if status == ProcessingStatus.PENDING:
-            self.icon_status.name = "access_time"
-            self.icon_status.color = "grey"
-        elif status == ProcessingStatus.PROCESSING:
-            self.icon_status.name = "loop"
-            self.icon_status.color = Colors.PRIMARY
-        elif status == ProcessingStatus.COMPLETED:
-            self.icon_status.name = "check_circle"
-            self.icon_status.color = Colors.SUCCESS
-        elif status == ProcessingStatus.ERROR or status == ProcessingStatus.CANCELLED:
-            self.icon_status.name = "error_outline"
-            self.icon_status.color = Colors.ERROR
+        self.margin = _FILE_ITEM_MARGIN
+
+    def _get_file_size_str(self, size_bytes: Optional[int] = None):
+        # Tamanho normalmente já vem do seletor de arquivos; stat só como fallback
+        if size_bytes is None:
+            try:
+                size_bytes = self.file_path.stat().st_size
+            except OSError:
+                return "Unknown size"
+        if size_bytes < 1024:
+            return f"{size_bytes} B"
+        elif size_bytes < 1024 * 1024:
+            return f"{size_bytes / 1024:.1f} KB"
+        else:
+            return f"{size_bytes / (1024 * 1024):.1f} MB"
+
+    def set_status(self, status: ProcessingStatus, message: str = "", update: bool = True) -> bool:
+        """
+        Atualiza o ícone de status. Com update=False só altera os atributos e quem chama
+        envia ao cliente (ex.: um único update da lista inteira).
+        Retorna False se o status e a mensagem já eram os exibidos.
+        """
+        if status == self._last_status and message == self._last_message:
+            return False
         
+        if status != self._last_status:
+            self._last_status = status
+            self.icon_status.name, self.icon_status.color = _STATUS_ICON[status]
+        # Mesmo ícone: só a mensagem mudou
+        self._last_message = message
         self.icon_status.tooltip = f"{status.value}: {message}" if message else status.value
-        self.update()
+        
+        if update:
+            self.update()
+        return True
 
 class SummaryPanel(ft.Container):
     def __init__(self):
@@ -126,10 +158,28 @@ class FiscalExtractorApp:
         self.output_dir = output_dir
         
         self.selected_files: List[Path] = []
+        # Índice de pertinência O(1) espelhando selected_files
+        self._selected_set: set[Path] = set()
+        # Chave = caminho completo (source_path de progresso e resultados): arquivos
+        # homônimos de pastas diferentes não se sobrescrevem
         self.file_controls: Dict[str, FileItemControl] = {}
         self.is_processing = False
         
         self.report_path: Optional[Path] = None
+        self._report_path_str: Optional[str] = None
+        
+        # Progresso acumulado entre flushes: status combinado de cada arquivo selecionado
+        # (os PDFs de um ZIP dividem a mesma linha; o tracker combina os status deles)
+        self._pending_status: Dict[str, Tuple[ProcessingStatus, str]] = {}
+        self._status_tracker = SourceStatusTracker()
+        self._pending_lock = threading.Lock()
+        self._flush_scheduled = False
+        
+        # Estado da última chamada de update_ui: bit 0 = has_files, bit 1 = is_processing
+        self._last_ui_state: int = -1
+        
+        # File Picker criado uma vez: build() repetido (hot reload) não duplica o overlay
+        self.file_picker = ft.FilePicker(on_result=self.on_files_selected)
 
     def build(self, page: ft.Page):
         self.page = page
@@ -174,7 +224,8 @@ class FiscalExtractorApp:
         )
 
         # --- File List ---
-        self.file_list_view = ft.Column(scroll=ft.ScrollMode.AUTO, expand=True)
+        # ListView: o cliente só constrói as linhas visíveis (Column renderiza todas)
+        self.file_list_view = ft.ListView(expand=True, spacing=10, auto_scroll=False)
         self.file_list_container = ft.Container(
             content=self.file_list_view,
             border=ft.border.all(1, "grey800"),
@@ -240,8 +291,8 @@ class FiscalExtractorApp:
         page.add(ft.Container(main_col, alignment=ft.alignment.center, expand=True))
 
         # File Picker
-        self.file_picker = ft.FilePicker(on_result=self.on_files_selected)
-        page.overlay.append(self.file_picker)
+        if self.file_picker not in page.overlay:
+            page.overlay.append(self.file_picker)
         page.update()
 
     def toggle_theme(self, e):
@@ -257,77 +308,115 @@ class FiscalExtractorApp:
 
     def pick_files(self, e):
         if self.is_processing: return
-        self.file_picker.pick_files(allowed_extensions=["pdf", "zip"], allow_multiple=True)
+        self.file_picker.pick_files(allowed_extensions=_ALLOWED_EXT, allow_multiple=True)
 
     def on_files_selected(self, e: ft.FilePickerResultEvent):
         if not e.files: return
         for f in e.files:
             path = Path(f.path)
-            if path not in self.selected_files:
+            if path not in self._selected_set:
+                self._selected_set.add(path)
                 self.selected_files.append(path)
-                item = FileItemControl(path, self.remove_file)
-                self.file_controls[path.name] = item
+                # FilePickerFile já traz o tamanho: evita um stat() por arquivo na seleção
+                item = FileItemControl(path, self.remove_file, size_bytes=f.size)
+                self.file_controls[str(path)] = item
                 self.file_list_view.controls.append(item)
         self.update_ui()
+        self.file_list_view.update()
 
     def remove_file(self, item):
         if self.is_processing: return
         try:
             self.selected_files.remove(item.file_path)
-            del self.file_controls[item.file_path.name]
+            self._selected_set.discard(item.file_path)
+            del self.file_controls[str(item.file_path)]
             self.file_list_view.controls.remove(item)
             self.update_ui()
+            self.file_list_view.update()
         except ValueError:
             pass
 
     def clear_files(self, e):
         if self.is_processing: return
+        # Esconde a lista antes de esvaziá-la: o cliente descarta a subárvore inteira de uma vez.
+        # A remoção das linhas segue no diff do próximo update da lista
+        self.file_list_container.visible = False
+        self.file_list_container.update()
+        
         self.selected_files.clear()
+        self._selected_set.clear()
         self.file_controls.clear()
         self.file_list_view.controls.clear()
         self.btn_download.visible = False
         self.summary_panel.visible = False
         self.status_text.value = ""
         self.update_ui()
+        for ctrl in (self.btn_download, self.summary_panel, self.status_text):
+            ctrl.update()
 
     def update_ui(self):
+        """
+        Ajusta os controles que dependem de (has_files, is_processing) e envia só esses.
+        Quem alterou outros controles chama o update() deles.
+        """
         has_files = len(self.selected_files) > 0
+        state = has_files | (self.is_processing << 1)
+        if state == self._last_ui_state:
+            return
+        self._last_ui_state = state
+        
         self.file_list_container.visible = has_files
         self.btn_process.disabled = not has_files or self.is_processing
         self.upload_area.visible = not self.is_processing
         self.btn_clear.visible = has_files and not self.is_processing
         self.btn_process.text = "Processando..." if self.is_processing else "Processar Arquivos"
-        self.page.update()
+        for ctrl in (self.file_list_container, self.btn_process, self.upload_area, self.btn_clear):
+            ctrl.update()
 
     def start_processing(self, e):
         if not self.selected_files: return
         self.is_processing = True
         self.report_path = None
+        self._report_path_str = None
         self.btn_download.visible = False
         self.summary_panel.visible = True
         self.summary_panel.update_stats(len(self.selected_files), 0, 0)
         self.status_text.value = "Iniciando processamento..."
         self.status_text.color = "grey"
         self.update_ui()
+        self.btn_download.update()
+        self.status_text.update()
         
-        # Reset icons
+        # Reset icons (um único envio para a lista inteira)
+        self._status_tracker = SourceStatusTracker()
         for ctrl in self.file_controls.values():
-            ctrl.set_status(ProcessingStatus.PENDING)
+            ctrl.set_status(ProcessingStatus.PENDING, update=False)
+        self.file_list_view.update()
 
-        import threading
-        threading.Thread(target=self._process_thread, daemon=True).start()
+        self.page.run_thread(self._process_thread)
 
     def _process_thread(self):
         try:
+            # Linhas do relatório montadas à medida que cada documento termina, enquanto os
+            # workers seguem extraindo; no fim resta só gravar o arquivo
+            document_rows, item_rows = [], []
+            
+            def on_result(res):
+                if res.status == ProcessingStatus.COMPLETED and res.document:
+                    document_rows.append(self.excel_reporter.build_document_row(res.document))
+                    item_rows.extend(self.excel_reporter.build_item_rows(res.document))
+            
             self.orchestrator.progress_callback = self.on_progress
+            self.orchestrator.result_callback = on_result
             result = self.orchestrator.process_files(self.selected_files)
             
             # Generate Report
-            successful_docs = [res.document for res in result.results if res.status == ProcessingStatus.COMPLETED and res.document]
-            
-            if successful_docs:
-                self.page.run_task(self._update_status_generating)
-                self.report_path = self.excel_reporter.generate_report(successful_docs)
+            if document_rows:
+                # update() síncrono direto desta thread: sem um run_task só para este aviso
+                self.status_text.value = "Gerando Excel..."
+                self.status_text.update()
+                self.report_path = self.excel_reporter.write_report(document_rows, item_rows)
+                self._report_path_str = str(self.report_path)
                 logger.info(f"Report: {self.report_path}")
 
             self.page.run_task(self._on_complete, result)
@@ -336,19 +425,37 @@ class FiscalExtractorApp:
             logger.error(f"Error: {e}")
             self.page.run_task(self._on_error, str(e))
 
-    async def _update_status_generating(self):
-        self.status_text.value = "Gerando Excel..."
-        self.page.update()
-
     def on_progress(self, update: ProgressUpdate):
-        # Update specific item
-        file_name = Path(update.current_file).name 
+        # Chamado pelas threads do orchestrator: só guarda o status combinado do arquivo.
+        # Um único flush agendado aplica tudo de uma vez (uma tarefa e um update da lista
+        # por intervalo, em vez de um por evento)
+        with self._pending_lock:
+            self._pending_status[update.source_path] = self._status_tracker.update(
+                update.source_path, update.current_file, update.status, update.message)
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
         
-        async def update_async():
-            if file_name in self.file_controls:
-                self.file_controls[file_name].set_status(update.status, update.message)
+        self.page.run_task(self._flush_status)
+
+    async def _flush_status(self):
+        while True:
+            with self._pending_lock:
+                pending, self._pending_status = self._pending_status, {}
+                if not pending:
+                    self._flush_scheduled = False
+                    return
+            
+            changed = False
+            for source_path, (status, message) in pending.items():
+                ctrl = self.file_controls.get(source_path)
+                if ctrl and ctrl.set_status(status, message, update=False):
+                    changed = True
+            if changed:
+                self.file_list_view.update()
             
-        self.page.run_task(update_async)
+            # Janela de agrupamento: eventos que chegarem enquanto isso vão no próximo flush
+            await asyncio.sleep(0.05)
 
     async def _on_complete(self, result: BatchProcessingResult):
         self.is_processing = False
@@ -357,10 +464,16 @@ class FiscalExtractorApp:
         
         self.summary_panel.update_stats(result.total_files, result.successful, result.failed)
         
-        # Consistency check for icons
+        # Consistency check for icons: status final combinado por arquivo selecionado
+        final_status = {}
+        tracker = SourceStatusTracker()
         for res in result.results:
-             if res.filename in self.file_controls:
-                 self.file_controls[res.filename].set_status(res.status, str(res.error.error_message) if res.error else "")
+            final_status[res.source_path] = tracker.update(
+                res.source_path, res.filename, res.status,
+                str(res.error.error_message) if res.error else "")
+        for source_path, (status, message) in final_status.items():
+            if source_path in self.file_controls:
+                self.file_controls[source_path].set_status(status, message)
 
         if self.report_path:
              self.btn_download.visible = True
@@ -381,5 +494,6 @@ class FiscalExtractorApp:
         self.page.update()
 
     def open_report(self, e):
-        if self.report_path:
-            os.startfile(str(self.report_path))
+        if self._report_path_str:
+            # startfile pode demorar resolvendo a associação do .xlsx: fora da thread da UI
+            threading.Thread(target=os.startfile, args=(self._report_path_str,), daemon=True).start()
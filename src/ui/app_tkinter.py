@@ -6,13 +6,16 @@ import customtkinter as ctk
 import tkinter as tk
 from tkinter import filedialog, messagebox, PhotoImage
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set
 import threading
+import os
+import shutil
 from loguru import logger
-import queue
+from collections import deque
+from functools import partial
 import io
 
-from models import ProcessingStatus
+from models import ProcessingStatus, SourceStatusTracker
 from core import ProcessingOrchestrator
 from utils import ExcelReporter
 
@@ -24,14 +27,35 @@ class Colors:
     CARD_BG = ("#e2e8f0", "#1e293b") # Light: Slate-200, Dark: Slate-800
     BG = ("#f8fafc", "#0f172a")      # Light: Slate-50, Dark: Slate-900
 
+def _fmt_size(size_bytes: Optional[int]) -> str:
+    """Tamanho legível (B/KB/MB); None quando o stat falhou"""
+    if size_bytes is None:
+        return "Unknown"
+    if size_bytes < 1024:
+        return f"{size_bytes} B"
+    if size_bytes < 1048576:
+        return f"{size_bytes / 1024:.1f} KB"
+    return f"{size_bytes / 1048576:.1f} MB"
+
 class FileItemFrame(ctk.CTkFrame):
     """Frame representing a file in the list"""
+    # Ícone e cor do rótulo de status para cada ProcessingStatus
+    _STATUS_STYLE = {
+        ProcessingStatus.PENDING: ("🕒", "gray"),
+        ProcessingStatus.PROCESSING: ("🔄", Colors.PRIMARY),
+        ProcessingStatus.COMPLETED: ("✅", Colors.SUCCESS),
+        ProcessingStatus.ERROR: ("⚠️", Colors.ERROR),
+        ProcessingStatus.CANCELLED: ("⚠️", Colors.ERROR),
+    }
+
     def __init__(self, master, file_path: Path, remove_callback, **kwargs):
         # Colors: Light Mode = Medium Gray (#bdbdbd), Dark Mode = Dark Gray (#374151)
         # User requested to match the header "Arquivos Carregados" tone (darker gray).
         super().__init__(master, fg_color=("#bdbdbd", "#374151"), corner_radius=8, **kwargs)
         self.file_path = file_path
         self.remove_callback = remove_callback
+        # Último status aplicado ao rótulo (a mensagem não é exibida, só o ícone)
+        self._current_status: Optional[ProcessingStatus] = None
 
         # Icon
         # Text Color: Black (Light Mode), White (Dark Mode)
@@ -45,7 +69,8 @@ class FileItemFrame(ctk.CTkFrame):
         self.lbl_name = ctk.CTkLabel(self.info_frame, text=file_path.name, font=("Segoe UI", 12, "bold"), anchor="w", text_color=("black", "white"))
         self.lbl_name.pack(fill="x")
 
-        self.lbl_size = ctk.CTkLabel(self.info_frame, text=self._get_file_size_str(), font=("Segoe UI", 10), text_color=("gray", "silver"), anchor="w")
+        # Tamanho preenchido depois por set_size (stat feito fora da thread da UI)
+        self.lbl_size = ctk.CTkLabel(self.info_frame, text="…", font=("Segoe UI", 10), text_color=("gray", "silver"), anchor="w")
         self.lbl_size.pack(fill="x")
 
         # Status
@@ -56,30 +81,19 @@ class FileItemFrame(ctk.CTkFrame):
         # Delete Button
         # Keep ERROR color (usually red) which works on both
         self.btn_delete = ctk.CTkButton(self, text="❌", width=30, height=30, fg_color="transparent", hover_color="#330000",
-                                        command=lambda: remove_callback(self), text_color=Colors.ERROR)
+                                        command=partial(remove_callback, self), text_color=Colors.ERROR)
         self.btn_delete.pack(side="right", padx=10)
 
-    def _get_file_size_str(self):
-        try:
-            size_bytes = self.file_path.stat().st_size
-            if size_bytes < 1024:
-                return f"{size_bytes} B"
-            elif size_bytes < 1024 * 1024:
-                return f"{size_bytes / 1024:.1f} KB"
-            else:
-                return f"{size_bytes / (1024 * 1024):.1f} MB"
-        except:
-            return "Unknown"
+    def set_size(self, size_bytes: Optional[int]):
+        self.lbl_size.configure(text=_fmt_size(size_bytes))
 
     def set_status(self, status: ProcessingStatus, message: str = ""):
-        if status == ProcessingStatus.PENDING:
-            self.lbl_status.configure(text="🕒", text_color="gray")
-        elif status == ProcessingStatus.PROCESSING:
-            self.lbl_status.configure(text="🔄", text_color=Colors.PRIMARY)
-        elif status == ProcessingStatus.COMPLETED:
-            self.lbl_status.configure(text="✅", text_color=Colors.SUCCESS)
-        elif status == ProcessingStatus.ERROR or status == ProcessingStatus.CANCELLED:
-            self.lbl_status.configure(text="⚠️", text_color=Colors.ERROR)
+        # configure() redesenha o widget: nada a fazer se o status não mudou
+        if status == self._current_status:
+            return
+        self._current_status = status
+        text, color = self._STATUS_STYLE.get(status, ("🕒", "gray"))
+        self.lbl_status.configure(text=text, text_color=color)
             
 class FiscalExtractorAppTk(ctk.CTk):
     def __init__(self, orchestrator: ProcessingOrchestrator, excel_reporter: ExcelReporter, output_dir: Path, icon_path: Optional[Path] = None):
@@ -115,16 +129,24 @@ class FiscalExtractorAppTk(ctk.CTk):
         ctk.set_default_color_theme("blue")
         
         self.selected_files: List[Path] = []
+        # Índice de pertinência O(1); a lista mantém a ordem de seleção
+        self._selected_set: Set[Path] = set()
         self.file_frames: Dict[str, FileItemFrame] = {}
         
-        # Queue for thread-safe UI updates
-        self.update_queue = queue.Queue()
+        # Fila worker -> UI: um produtor (thread de processamento) e um consumidor
+        # (loop do Tk); append/popleft do deque são atômicos, sem lock como no queue.Queue
+        self.update_queue = deque()
+        # Há um _drain_updates agendado? (o polling só roda enquanto há trabalho)
+        self._drain_pending = False
+        # Status combinado por linha (os PDFs de um ZIP dividem a mesma linha)
+        self._status_tracker = SourceStatusTracker()
+        # Threads lendo tamanhos de arquivo (pick_files)
+        self._size_threads: List[threading.Thread] = []
         
         # Processing state flag
         self.is_processing = False
         
         self._setup_ui()
-        self._start_update_loop()
 
     def _center_window(self, width: int, height: int):
         """Centers the window on the screen."""
@@ -208,6 +230,9 @@ class FiscalExtractorAppTk(ctk.CTk):
         
         # Track maximum progress to prevent regression
         self.max_progress_value = 0.0
+        # Alvo atual da animação da barra e se o ticker (_progress_tick) está agendado
+        self._progress_target = 0.0
+        self._progress_tick_scheduled = False
 
         # File List (Scrollable) (Shifted to Row 3)
         # Fixed height to limit visibility to ~5 items (approx 250px)
@@ -248,14 +273,35 @@ class FiscalExtractorAppTk(ctk.CTk):
         filetypes = (("PDF Files", "*.pdf"), ("ZIP Files", "*.zip"), ("All Files", "*.*"))
         paths = filedialog.askopenfilenames(title="Selecione os arquivos", filetypes=filetypes)
         
+        new_paths = []
         for p in paths:
             path_obj = Path(p)
-            if path_obj not in self.selected_files:
+            if path_obj not in self._selected_set:
+                self._selected_set.add(path_obj)
                 self.selected_files.append(path_obj)
                 self._add_file_item(path_obj)
+                new_paths.append(path_obj)
+        
+        if new_paths:
+            # stat() em disco lento/rede travaria a UI: tamanhos lidos numa thread e
+            # aplicados pelo _drain_updates
+            thread = threading.Thread(target=self._stat_sizes, args=(new_paths,), daemon=True)
+            self._size_threads.append(thread)
+            thread.start()
+            self._schedule_drain()
         
         self._update_ui_state()
 
+    def _stat_sizes(self, paths: List[Path]):
+        """Worker thread: read file sizes and queue them for the UI"""
+        sizes = []
+        for path in paths:
+            try:
+                sizes.append((str(path), path.stat().st_size))
+            except OSError:
+                sizes.append((str(path), None))
+        self.update_queue.append(("sizes", sizes))
+
     def _add_file_item(self, path: Path):
         item = FileItemFrame(self.scroll_frame, path, self.remove_file)
         item.pack(fill="x", pady=2, padx=5)
@@ -263,7 +309,8 @@ class FiscalExtractorAppTk(ctk.CTk):
 
     def remove_file(self, item_frame):
         path = item_frame.file_path
-        if path in self.selected_files:
+        if path in self._selected_set:
+            self._selected_set.discard(path)
             self.selected_files.remove(path)
         
         item_frame.destroy()
@@ -284,7 +331,9 @@ class FiscalExtractorAppTk(ctk.CTk):
             frame.destroy()
         self.file_frames.clear()
         self.selected_files.clear()
+        self._selected_set.clear()
         self.progress_bar.set(0) # Reset progress
+        self._progress_target = 0.0
         self.lbl_progress_percent.configure(text="0%")
         
         # Hide progress bar and percentage (will reappear on next processing)
@@ -303,8 +352,6 @@ class FiscalExtractorAppTk(ctk.CTk):
         else:
             self.btn_process.configure(state="disabled")
 
-            self.btn_process.configure(state="disabled")
-
     def _toggle_ai(self):
         """Toggle AI/LLM usage in extractor"""
         enabled = self.ai_var.get()
@@ -315,19 +362,30 @@ class FiscalExtractorAppTk(ctk.CTk):
     def _animate_progress(self, target_value: float):
         """Animate progress bar incrementally (never goes backwards)"""
         # Ensure progress never goes backwards (monotonic increase)
-        if target_value < self.max_progress_value:
-            target_value = self.max_progress_value
-        else:
-            self.max_progress_value = target_value
-        
+        target_value = max(target_value, self.max_progress_value)
+        self.max_progress_value = target_value
+        
+        # Só atualiza o alvo: um único ticker (~30 fps) leva a barra até ele,
+        # em vez de uma cadeia de after(10) por atualização
+        self._progress_target = target_value
+        # Alvo repetido/já alcançado (ex.: arquivos de um ZIP terminando juntos): nada a agendar
+        if self._progress_tick_scheduled or self.progress_bar.get() + 1e-6 >= target_value:
+            return
+        self._progress_tick_scheduled = True
+        self.after(33, self._progress_tick)
+    
+    def _progress_tick(self):
+        """One animation frame toward _progress_target; re-arms itself until reached"""
         current_value = self.progress_bar.get()
+        target_value = self._progress_target
         
         # If target reached, stop
         if current_value >= target_value:
+            self._progress_tick_scheduled = False
             return
         
-        # Calculate step (e.g., 1% of the distance or fixed 0.01)
-        step = 0.01
+        # Passo proporcional à distância: alcança o alvo em ~10 quadros
+        step = max(0.01, (target_value - current_value) / 10)
         new_value = min(target_value, current_value + step)
         
         self.progress_bar.set(new_value)
@@ -335,7 +393,9 @@ class FiscalExtractorAppTk(ctk.CTk):
         
         # Schedule next update if not reached
         if new_value < target_value:
-            self.after(10, lambda: self._animate_progress(target_value))
+            self.after(33, self._progress_tick)
+        else:
+            self._progress_tick_scheduled = False
 
     def start_processing(self):
         if not self.selected_files: return
@@ -344,7 +404,6 @@ class FiscalExtractorAppTk(ctk.CTk):
         self.upload_btn.configure(state="disabled")
         self.btn_clear.configure(state="disabled")
         self.btn_download.configure(state="disabled")
-        self.btn_download.configure(state="disabled")
         
         # Ensure progress bar and label are visible
         self.progress_bar.grid(row=1, column=0, sticky="ew", pady=(0, 20), padx=(0, 40))
@@ -352,6 +411,7 @@ class FiscalExtractorAppTk(ctk.CTk):
         self.progress_bar.set(0)
         self.lbl_progress_percent.configure(text="0%")
         self.max_progress_value = 0.0  # Reset max progress tracker
+        self._progress_target = 0.0
         
         # Show processing status label
         self.lbl_processing_status.pack(anchor="w", pady=(2, 0))
@@ -362,17 +422,19 @@ class FiscalExtractorAppTk(ctk.CTk):
         self.btn_clear.configure(text="Cancelar", state="normal")  # Enable for cancellation
         
         # Reset icons
+        self._status_tracker = SourceStatusTracker()
         for frame in self.file_frames.values():
             frame.set_status(ProcessingStatus.PENDING)
 
         threading.Thread(target=self._process_thread, daemon=True).start()
+        self._schedule_drain()
 
     def _process_thread(self):
-        self.update_queue.put(("status", "Iniciando processamento..."))
+        self.update_queue.append(("status", "Iniciando processamento..."))
         
         # Synchronous callback bridge
         def sync_callback(update):
-            self.update_queue.put(("progress", update))
+            self.update_queue.append(("progress", update))
 
         # Inject callback into orchestrator
         self.orchestrator.progress_callback = sync_callback
@@ -385,57 +447,87 @@ class FiscalExtractorAppTk(ctk.CTk):
             
             report_path = None
             if successful_docs:
+                # A UI mostra a etapa do Excel em vez de ficar parada em 100%
+                self.update_queue.append(("status", "Gerando relatório..."))
                 report_path = self.excel_reporter.generate_report(successful_docs)
             
-            self.update_queue.put(("done", (result, report_path)))
+            self.update_queue.append(("done", (result, report_path)))
             
         except Exception as e:
-            self.update_queue.put(("error", str(e)))
-
-    def _start_update_loop(self):
-        """Poll the queue for updates from the thread"""
-        try:
-            while True:
-                msg_type, data = self.update_queue.get_nowait()
-                
-                if msg_type == "status":
-                    pass # maybe show toast
-                elif msg_type == "progress":
-                    # Update progress bar
-                    if data.total_files > 0:
-                        target_progress = data.current_index / data.total_files
-                        # Use animation instead of jump
-                        self._animate_progress(target_progress)
-                        
-                        # Update "Processando arquivo X de Y" label
-                        self.lbl_processing_status.configure(
-                            text=f"Processando arquivo {data.current_index} de {data.total_files}"
-                        )
-                    
-                    # Update specific item status (Corrigido para buscar pelo nome)
-                    target_name = data.current_file
-                    for frame_path_str, frame in self.file_frames.items():
-                        # Compara apenas o nome do arquivo (ex: 'nota.pdf') com o alvo
-                        if Path(frame_path_str).name == target_name:
-                            frame.set_status(data.status, data.message)
-                            break
-
-
-                elif msg_type == "done":
-                    result, report_path = data
-                    self._on_processing_complete(result, report_path)
-                
-                elif msg_type == "error":
-                    messagebox.showerror("Erro", str(data))
-                    # Reset processing state on error
-                    self.is_processing = False
-                    self.btn_clear.configure(text="Limpar", state="normal")
-                    self._reset_ui()
-
-        except queue.Empty:
-            pass
-        
-        self.after(100, self._start_update_loop)
+            self.update_queue.append(("error", str(e)))
+
+    def _schedule_drain(self, delay_ms: int = 100):
+        """Schedule one _drain_updates cycle (Tk thread only) unless one is already pending"""
+        if not self._drain_pending:
+            self._drain_pending = True
+            self.after(delay_ms, self._drain_updates)
+
+    def _drain_updates(self):
+        """Apply the updates queued by the processing thread"""
+        self._drain_pending = False
+        
+        # Esvazia a fila inteira e aplica o lote de uma vez: a barra e o rótulo
+        # mudam uma vez por ciclo e cada arquivo recebe só o seu status combinado
+        msgs = []
+        while self.update_queue:
+            msgs.append(self.update_queue.popleft())
+        
+        last_progress = None
+        max_index = 0
+        status_label = None
+        file_status = {}
+        terminal = []
+        for msg_type, data in msgs:
+            if msg_type == "status":
+                status_label = data
+            elif msg_type == "sizes":
+                for key, size_bytes in data:
+                    frame = self.file_frames.get(key)
+                    if frame:
+                        frame.set_size(size_bytes)
+            elif msg_type == "progress":
+                last_progress = data
+                max_index = max(max_index, data.current_index)
+                if data.total_files > 0:
+                    status_label = f"Processando arquivo {data.current_index} de {data.total_files}"
+                # source_path = caminho selecionado (mesma chave de file_frames); os PDFs
+                # de um ZIP dividem a linha e o tracker combina os status deles
+                file_status[data.source_path] = self._status_tracker.update(
+                    data.source_path, data.current_file, data.status, data.message)
+            else:
+                terminal.append((msg_type, data))
+        
+        if last_progress is not None and last_progress.total_files > 0:
+            # Use animation instead of jump
+            self._animate_progress(max_index / last_progress.total_files)
+        
+        # "Processando arquivo X de Y" ou a etapa atual, o que chegou por último
+        if status_label is not None:
+            self.lbl_processing_status.configure(text=status_label)
+        
+        # Update specific item status
+        for source_path, (status, message) in file_status.items():
+            frame = self.file_frames.get(source_path)
+            if frame:
+                frame.set_status(status, message)
+        
+        for msg_type, data in terminal:
+            if msg_type == "done":
+                result, report_path = data
+                self._on_processing_complete(result, report_path)
+            
+            elif msg_type == "error":
+                messagebox.showerror("Erro", str(data))
+                # Reset processing state on error
+                self.is_processing = False
+                self.btn_clear.configure(text="Limpar", state="normal")
+                self._reset_ui()
+        
+        # Continua consultando só enquanto houver processamento, leitura de tamanhos
+        # ou mensagens; com o app ocioso nenhum timer fica ativo
+        self._size_threads = [t for t in self._size_threads if t.is_alive()]
+        if self.is_processing or self._size_threads or self.update_queue:
+            self._schedule_drain()
 
     def _on_processing_complete(self, result, report_path):
         self.max_progress_value = 1.0  # Allow animation to 100%
@@ -452,17 +544,17 @@ class FiscalExtractorAppTk(ctk.CTk):
         self.stats_label.configure(text=f"Total: {result.total_files} | Sucesso: {result.successful} | Erros: {result.failed}")
         
         # Update individual icons final state
+        # source_path = arquivo selecionado (PDF ou ZIP de origem), mesma chave de file_frames
+        # (status final combinado: um PDF com erro num ZIP marca a linha do ZIP como erro)
+        final_status = {}
+        tracker = SourceStatusTracker()
         for res in result.results:
-            # Again, res.filename is likely just the name if using original Orchestrator logic.
-            # But let's check ProcessingResult.filename.
-            # It comes from _process_single_file -> filename arg.
-            
-            target_name = res.filename
-            for frame_path_str, frame in self.file_frames.items():
-                # We match by name because Orchestrator only tracks name currently (for ZIPs essentially)
-                if Path(frame_path_str).name == target_name:
-                    frame.set_status(res.status)
-                    break
+            final_status[res.source_path] = tracker.update(res.source_path, res.filename, res.status)
+        lookup = self.file_frames.get
+        for source_path, (status, _) in final_status.items():
+            frame = lookup(source_path)
+            if frame is not None:
+                frame.set_status(status)
 
         # Check if processing was cancelled
         if self.orchestrator.is_cancelled():
@@ -506,7 +598,7 @@ class FiscalExtractorAppTk(ctk.CTk):
         if not self.report_path:
             return
         # Sugere o mesmo nome do arquivo gerado
-        initial_file = os.path.basename(self.report_path)
+        initial_file = Path(self.report_path).name
         
         # Abre diálogo para Salvar Como
         dest_path = filedialog.asksaveasfilename(
@@ -518,7 +610,6 @@ class FiscalExtractorAppTk(ctk.CTk):
     
         if dest_path:
             try:
-                import shutil
                 shutil.copy2(self.report_path, dest_path)
                 messagebox.showinfo("Sucesso", f"Relatório salvo em:\n{dest_path}")
             
@@ -527,5 +618,3 @@ class FiscalExtractorAppTk(ctk.CTk):
                     os.startfile(dest_path)
             except Exception as e:
                 messagebox.showerror("Erro", f"Erro ao salvar arquivo:\n{str(e)}")
-        
-import os
@@ -2,15 +2,31 @@
 Excel report generation utilities.
 """
 from pathlib import Path
-from typing import List
+from typing import List, Tuple, Any
 from datetime import datetime
-import pandas as pd
-from openpyxl import load_workbook
+from functools import lru_cache
+from itertools import islice
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
 from loguru import logger
 
-from models import FiscalDocument, ServiceItem
+from models import FiscalDocument, ServiceItem, digits_only
+
+
+# Datas e CNPJs se repetem muito num lote (mesmo fornecedor, mesmo dia): funções puras em cache
+@lru_cache(maxsize=4096)
+def _format_date_cached(dt) -> str:
+    return dt.strftime("%d/%m/%Y")
+
+
+@lru_cache(maxsize=4096)
+def _clean_cnpj_cached(value: str) -> str:
+    # Entity.cnpj já vem só com dígitos (validate_cnpj): evita a tradução
+    if value.isdigit():
+        return value
+    return digits_only(value)
 
 
 class ExcelReporter:
@@ -25,23 +41,41 @@ class ExcelReporter:
         top=Side(style='thin'),
         bottom=Side(style='thin')
     )
+    HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='center')
+    WIDTH_SAMPLE_ROWS = 500  # Rows sampled for column auto-fit
+    
+    # Columns in exact order matching web version
+    DOC_COLUMNS = (
+        'Tipo Documento', 'Número Documento', 'Data Emissão', 'Data Saída/Entrada',
+        'Emitente CNPJ/CPF', 'Emitente Nome/Razão Social', 'Emitente Endereço',
+        'Destinatário CNPJ/CPF', 'COLIGADA', 'FILIAL',
+        'Destinatário Nome/Razão Social', 'Destinatário Endereço',
+        'Valor Total Documento', 'Valor Líquido Documento', 'Valor Total Produtos/Serviços',
+        'Valor Frete', 'Valor Desconto',
+        'ICMS', 'IPI', 'PIS', 'COFINS', 'ISS',
+        'IRRF Retido', 'INSS Retido', 'PIS Retido', 'COFINS Retido', 'CSLL Retida', 'ISS Retido (Serviço)',
+        'Chave Acesso NF-e', 'Observações Extração',
+    )
+    _NO_VALUES = (None,) * 16  # Colunas de valores de um documento sem TaxValues
+    ITEM_COLUMNS = (
+        'Arquivo', 'Número Documento', 'Item', 'Código', 'Descrição', 'Quantidade', 'Unidade',
+        'Valor Unitário', 'Valor Total', 'Alíquota ISS (%)', 'Valor ISS',
+    )
     
     def __init__(self, output_dir: Path):
         self.output_dir = Path(output_dir)
-        self.output_dir = Path(output_dir)
-        self.output_dir.mkdir(parents=True, exist_ok=True)
         
     def _format_date(self, dt: datetime.date) -> str:
         """Format date as DD/MM/YYYY"""
         if not dt:
             return None
-        return dt.strftime("%d/%m/%Y")
+        return _format_date_cached(dt)
     
     def _clean_cnpj(self, value: str) -> str:
         """Remove punctuation from CNPJ/CPF"""
         if not value:
             return None
-        return "".join(filter(str.isdigit, str(value)))
+        return _clean_cnpj_cached(str(value))
 
     def generate_report(self, documents: List[FiscalDocument]) -> Path:
         """
@@ -52,156 +86,150 @@ class ExcelReporter:
         if not documents:
             raise ValueError("No documents to generate report")
         
+        document_rows = [self.build_document_row(doc) for doc in documents]
+        item_rows = [row for doc in documents for row in self.build_item_rows(doc)]
+        return self.write_report(document_rows, item_rows)
+    
+    def write_report(self, document_rows: List[Tuple[Any, ...]], item_rows: List[Tuple[Any, ...]]) -> Path:
+        """
+        Write pre-built rows (see build_document_row/build_item_rows) to a new report.
+        Lets callers build rows as each document finishes instead of all at the end.
+        """
+        if not document_rows:
+            raise ValueError("No documents to generate report")
+        
+        # Pasta criada só quando um relatório é de fato gravado
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        
         # Generate filename with timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_file = self.output_dir / f"relatorio_fiscal_{timestamp}.xlsx"
         
-        # Create DataFrames
-        df_documents = self._create_documents_dataframe(documents)
-        df_items = self._create_items_dataframe(documents)
-        
-        # Write to Excel
-        with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-            df_documents.to_excel(writer, sheet_name='Documentos Fiscais', index=False)
-            df_items.to_excel(writer, sheet_name='Itens e Serviços', index=False)
-        
-        # Apply formatting
-        self._apply_formatting(output_file)
+        # Escrita em uma passada (write_only): linhas vão direto para o arquivo já formatadas,
+        # sem DataFrame intermediário nem reabrir a planilha para aplicar estilos
+        wb = Workbook(write_only=True)
+        self._write_sheet(wb, 'Documentos Fiscais', self.DOC_COLUMNS, document_rows)
+        self._write_sheet(wb, 'Itens e Serviços', self.ITEM_COLUMNS, item_rows)
+        wb.save(output_file)
         
         logger.info(f"Generated Excel report: {output_file}")
         return output_file
     
-    def _create_documents_dataframe(self, documents: List[FiscalDocument]) -> pd.DataFrame:
-        """Create DataFrame for documents sheet"""
-        rows = []
+    def build_document_row(self, doc: FiscalDocument) -> Tuple[Any, ...]:
+        """Row of the 'Documentos Fiscais' sheet for one document (in DOC_COLUMNS order)"""
+        fmt, cnpj = self._format_date, self._clean_cnpj
+        em = doc.emitente
+        de = doc.destinatario
+        vals = doc.valores
+        em_end = em.endereco if em else None
+        de_end = de.endereco if de else None
         
-        for doc in documents:
-            row = {
-                # Columns in exact order matching web version
-                'Tipo Documento': doc.document_type.value,
-                'Número Documento': doc.numero,
-                'Data Emissão': self._format_date(doc.data_emissao),
-                'Data Saída/Entrada': self._format_date(doc.data_saida_entrada),
-                
-                # Emitente
-                'Emitente CNPJ/CPF': self._clean_cnpj(doc.emitente.cnpj) if doc.emitente else None,
-                'Emitente Nome/Razão Social': doc.emitente.razao_social if doc.emitente else None,
-                'Emitente Endereço': doc.emitente.endereco.to_string() if doc.emitente and doc.emitente.endereco else None,
-                
-                # Destinatário
-                'Destinatário CNPJ/CPF': self._clean_cnpj(doc.destinatario.cnpj) if doc.destinatario else None,
-                
-                # Filiais
-                'COLIGADA': doc.coligada,
-                'FILIAL': doc.filial,
-                
-                'Destinatário Nome/Razão Social': doc.destinatario.razao_social if doc.destinatario else None,
-                'Destinatário Endereço': doc.destinatario.endereco.to_string() if doc.destinatario and doc.destinatario.endereco else None,
-                
-                # Valores
-                'Valor Total Documento': doc.valores.valor_total if doc.valores else None,
-                'Valor Líquido Documento': doc.valores.valor_liquido if doc.valores else None,
-                'Valor Total Produtos/Serviços': doc.valores.valor_servicos if doc.valores else None,
-                'Valor Frete': None,  # Not currently extracted
-                'Valor Desconto': doc.valores.desconto if doc.valores else None,
+        # Valores, impostos e retenções: um único teste de doc.valores para as 16 colunas
+        if vals:
+            valores = (
+                vals.valor_total,
+                vals.valor_liquido,
+                vals.valor_servicos,
+                None,  # Valor Frete: not currently extracted
+                vals.desconto,
                 
                 # Impostos (NF-e: ICMS, IPI, PIS, COFINS)
-                'ICMS': doc.valores.icms if doc.valores else None,
-                'IPI': doc.valores.ipi if doc.valores else None,
-                'PIS': doc.valores.pis if doc.valores else None,
-                'COFINS': doc.valores.cofins if doc.valores else None,
+                vals.icms,
+                vals.ipi,
+                vals.pis,
+                vals.cofins,
                 
                 # ISS (Devido para NFS-e)
-                'ISS': doc.valores.iss if doc.valores else None,
+                vals.iss,
                 
                 # Retenções (NFS-e: valores retidos na fonte)
-                'IRRF Retido': doc.valores.ir if doc.valores else None,
-                'INSS Retido': doc.valores.inss if doc.valores else None,
-                'PIS Retido': doc.valores.pis_retido if doc.valores else None,
-                'COFINS Retido': doc.valores.cofins_retido if doc.valores else None,
-                'CSLL Retida': doc.valores.csll_retida if doc.valores else None,
-                'ISS Retido (Serviço)': doc.valores.iss_retido if doc.valores else None,
-                
-                'Chave Acesso NF-e': doc.chave_acesso,
-                'Observações Extração': doc.error_message if doc.error_message else ("Documento Escaneado" if doc.is_scanned else None),
-            }
-            rows.append(row)
-        
-        return pd.DataFrame(rows)
-    
-    def _create_items_dataframe(self, documents: List[FiscalDocument]) -> pd.DataFrame:
-        """Create DataFrame for items/services sheet"""
-        rows = []
-        
-        for doc in documents:
-            if not doc.itens:
-                # Add empty row to maintain document reference
-                rows.append({
-                    'Arquivo': doc.filename,
-                    'Número Documento': doc.numero,
-                    'Item': None,
-                    'Código': None,
-                    'Descrição': None,
-                    'Quantidade': None,
-                    'Unidade': None,
-                    'Valor Unitário': None,
-                    'Valor Total': None,
-                    'Alíquota ISS (%)': None,
-                    'Valor ISS': None,
-                })
-            else:
-                for item in doc.itens:
-                    row = {
-                        'Arquivo': doc.filename,
-                        'Número Documento': doc.numero,
-                        'Item': item.item_numero,
-                        'Código': item.codigo,
-                        'Descrição': item.descricao,
-                        'Quantidade': item.quantidade,
-                        'Unidade': item.unidade,
-                        'Valor Unitário': item.valor_unitario,
-                        'Valor Total': item.valor_total,
-                        'Alíquota ISS (%)': item.aliquota_iss,
-                        'Valor ISS': item.valor_iss,
-                    }
-                    rows.append(row)
-        
-        return pd.DataFrame(rows)
-    
-    def _apply_formatting(self, excel_file: Path):
-        """Apply Excel formatting (headers, borders, column widths)"""
-        wb = load_workbook(excel_file)
+                vals.ir,
+                vals.inss,
+                vals.pis_retido,
+                vals.cofins_retido,
+                vals.csll_retida,
+                vals.iss_retido,
+            )
+        else:
+            valores = self._NO_VALUES
         
-        for sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
+        return (
+            doc.document_type.value,
+            doc.numero,
+            fmt(doc.data_emissao),
+            fmt(doc.data_saida_entrada),
             
-            # Format header row
-            for cell in ws[1]:
-                cell.font = self.HEADER_FONT
-                cell.fill = self.HEADER_FILL
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-                cell.border = self.BORDER_THIN
+            # Emitente
+            cnpj(em.cnpj) if em else None,
+            em.razao_social if em else None,
+            em_end.to_string() if em_end else None,
             
-            # Auto-fit columns
-            for column in ws.columns:
-                max_length = 0
-                column_letter = get_column_letter(column[0].column)
-                
-                for cell in column:
-                    try:
-                        if cell.value:
-                            max_length = max(max_length, len(str(cell.value)))
-                    except:
-                        pass
-                
-                adjusted_width = min(max_length + 2, 50)  # Cap at 50
-                ws.column_dimensions[column_letter].width = adjusted_width
+            # Destinatário
+            cnpj(de.cnpj) if de else None,
             
-            # Apply filters
-            ws.auto_filter.ref = ws.dimensions
+            # Filiais
+            doc.coligada,
+            doc.filial,
             
-            # Freeze header row
-            ws.freeze_panes = 'A2'
+            de.razao_social if de else None,
+            de_end.to_string() if de_end else None,
+        ) + valores + (
+            doc.chave_acesso,
+            doc.error_message or ("Documento Escaneado" if doc.is_scanned else None),
+        )
+    
+    def build_item_rows(self, doc: FiscalDocument) -> List[Tuple[Any, ...]]:
+        """Rows of the 'Itens e Serviços' sheet for one document (in ITEM_COLUMNS order)"""
+        if not doc.itens:
+            # Add empty row to maintain document reference
+            return [(doc.filename, doc.numero) + (None,) * 9]
+        
+        return [
+            (
+                doc.filename,
+                doc.numero,
+                item.item_numero,
+                item.codigo,
+                item.descricao,
+                item.quantidade,
+                item.unidade,
+                item.valor_unitario,
+                item.valor_total,
+                item.aliquota_iss,
+                item.valor_iss,
+            )
+            for item in doc.itens
+        ]
+    
+    def _write_sheet(self, wb: Workbook, title: str, headers: Tuple[str, ...], values: List[Tuple[Any, ...]]):
+        """Write one formatted sheet (header style, column widths, filter, frozen header)"""
+        ws = wb.create_sheet(title)
+        
+        # Em write_only larguras e painéis precisam ser definidos antes da primeira linha.
+        # Largura estimada pelas primeiras linhas: não converte toda a planilha em str
+        widths = [len(h) for h in headers]
+        for row in islice(values, self.WIDTH_SAMPLE_ROWS):
+            for j, value in enumerate(row):
+                if value:
+                    widths[j] = max(widths[j], len(str(value)))
+        for j, width in enumerate(widths, start=1):
+            ws.column_dimensions[get_column_letter(j)].width = min(width + 2, 50)  # Cap at 50
+        
+        # Freeze header row
+        ws.freeze_panes = 'A2'
+        # Apply filters
+        ws.auto_filter.ref = f"A1:{get_column_letter(len(headers))}{len(values) + 1}"
+        
+        # Format header row
+        header_cells = []
+        for h in headers:
+            cell = WriteOnlyCell(ws, value=h)
+            cell.font = self.HEADER_FONT
+            cell.fill = self.HEADER_FILL
+            cell.alignment = self.HEADER_ALIGNMENT
+            cell.border = self.BORDER_THIN
+            header_cells.append(cell)
+        ws.append(header_cells)
         
-        wb.save(excel_file)
-        logger.debug(f"Applied formatting to {excel_file}")
+        for row in values:
+            ws.append(row)
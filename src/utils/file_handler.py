@@ -2,12 +2,17 @@
 File handling utilities for PDF and ZIP files.
 """
 from pathlib import Path
-from typing import List, BinaryIO, Tuple
+from typing import List, BinaryIO, Tuple, Optional
 import zipfile
 import io
+from concurrent.futures import ThreadPoolExecutor
+import threading
 from loguru import logger
 
 
+_ZIP_READ_WORKERS = 8  # Threads de descompressão por ZIP
+
+
 class FileValidator:
     """Validates file types and formats"""
     
@@ -15,13 +20,17 @@ class FileValidator:
     PDF_MAGIC = b'%PDF'
     ZIP_MAGIC = b'PK\x03\x04'
     
+    @staticmethod
+    def read_magic(file_path: Path) -> bytes:
+        """Read the first 4 bytes of a file (raises OSError)"""
+        with open(file_path, 'rb') as f:
+            return f.read(4)
+    
     @staticmethod
     def is_pdf(file_path: Path) -> bool:
         """Check if file is a valid PDF"""
         try:
-            with open(file_path, 'rb') as f:
-                header = f.read(4)
-                return header == FileValidator.PDF_MAGIC
+            return FileValidator.read_magic(file_path) == FileValidator.PDF_MAGIC
         except Exception as e:
             logger.error(f"Error checking PDF: {file_path} - {e}")
             return False
@@ -29,15 +38,21 @@ class FileValidator:
     @staticmethod
     def is_pdf_from_bytes(data: bytes) -> bool:
         """Check if byte data is a valid PDF"""
-        return data[:4] == FileValidator.PDF_MAGIC
+        return data.startswith(FileValidator.PDF_MAGIC)
+    
+    @staticmethod
+    def is_pdf_from_stream(stream: BinaryIO) -> bool:
+        """Check if a seekable stream starts with the PDF magic (position is restored)"""
+        pos = stream.tell()
+        header = stream.read(4)
+        stream.seek(pos)
+        return header == FileValidator.PDF_MAGIC
     
     @staticmethod
     def is_zip(file_path: Path) -> bool:
         """Check if file is a valid ZIP"""
         try:
-            with open(file_path, 'rb') as f:
-                header = f.read(4)
-                return header == FileValidator.ZIP_MAGIC
+            return FileValidator.read_magic(file_path) == FileValidator.ZIP_MAGIC
         except Exception as e:
             logger.error(f"Error checking ZIP: {file_path} - {e}")
             return False
@@ -54,10 +69,17 @@ class FileValidator:
         if not file_path.is_file():
             return False, "Not a file"
         
-        if FileValidator.is_pdf(file_path):
+        # Um único open/read do cabeçalho para os dois testes
+        try:
+            header = FileValidator.read_magic(file_path)
+        except Exception as e:
+            logger.error(f"Error reading file header: {file_path} - {e}")
+            return False, "Unreadable file"
+        
+        if header == FileValidator.PDF_MAGIC:
             return True, "PDF"
         
-        if FileValidator.is_zip(file_path):
+        if header == FileValidator.ZIP_MAGIC:
             return True, "ZIP"
         
         return False, "Unsupported file type"
@@ -66,39 +88,60 @@ class FileValidator:
 class ZIPExtractor:
     """Extracts PDF files from ZIP archives in-memory"""
     
+    @staticmethod
+    def _read_pdf(zip_ref: zipfile.ZipFile, file_info: zipfile.ZipInfo) -> Optional[bytes]:
+        """
+        Decompress one entry if it is a PDF, else None.
+        O magic é lido do stream antes: entradas .pdf inválidas não são descomprimidas inteiras.
+        """
+        with zip_ref.open(file_info) as f:
+            if not FileValidator.is_pdf_from_stream(f):
+                return None
+            return f.read()
+    
+    @staticmethod
+    def _extract_entry(zip_ref: zipfile.ZipFile, file_info: zipfile.ZipInfo) -> Optional[Tuple[str, bytes]]:
+        """Extract one .pdf entry as (filename, pdf_bytes); None if invalid or unreadable"""
+        filename = file_info.filename
+        try:
+            pdf_bytes = ZIPExtractor._read_pdf(zip_ref, file_info)
+            
+            # Verify it's actually a PDF
+            if pdf_bytes is None:
+                logger.warning(f"File has .pdf extension but invalid format: {filename}")
+                return None
+            
+            # Get just the filename without path
+            clean_filename = Path(filename).name
+            logger.debug(f"Extracted PDF from ZIP: {clean_filename}")
+            return clean_filename, pdf_bytes
+        except Exception as e:
+            logger.error(f"Error extracting {filename} from ZIP: {e}")
+            return None
+    
     @staticmethod
     def extract_pdfs(zip_path: Path) -> List[Tuple[str, bytes]]:
         """
         Extract all PDF files from a ZIP archive.
-        Returns list of (filename, pdf_bytes) tuples.
+        Returns list of (filename, pdf_bytes) tuples, in archive order.
         """
         pdfs = []
         
         try:
             with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                for file_info in zip_ref.filelist:
-                    # Skip directories
-                    if file_info.is_dir():
-                        continue
-                    
-                    filename = file_info.filename
-                    
-                    # Check if it's a PDF by extension or magic bytes
-                    if filename.lower().endswith('.pdf'):
-                        try:
-                            pdf_bytes = zip_ref.read(filename)
-                            
-                            # Verify it's actually a PDF
-                            if FileValidator.is_pdf_from_bytes(pdf_bytes):
-                                # Get just the filename without path
-                                clean_filename = Path(filename).name
-                                pdfs.append((clean_filename, pdf_bytes))
-                                logger.debug(f"Extracted PDF from ZIP: {clean_filename}")
-                            else:
-                                logger.warning(f"File has .pdf extension but invalid format: {filename}")
-                        except Exception as e:
-                            logger.error(f"Error extracting {filename} from ZIP: {e}")
+                # Skip directories; PDFs by extension (magic bytes checked on extraction)
+                pdf_infos = [
+                    file_info for file_info in zip_ref.filelist
+                    if not file_info.is_dir() and file_info.filename.lower().endswith('.pdf')
+                ]
+                
+                if len(pdf_infos) < 2:
+                    entries = [ZIPExtractor._extract_entry(zip_ref, file_info) for file_info in pdf_infos]
+            
+            if len(pdf_infos) >= 2:
+                entries = ZIPExtractor._extract_parallel(zip_path, pdf_infos)
             
+            pdfs = [entry for entry in entries if entry is not None]
             logger.info(f"Extracted {len(pdfs)} PDFs from {zip_path.name}")
             
         except zipfile.BadZipFile:
@@ -108,6 +151,29 @@ class ZIPExtractor:
         
         return pdfs
     
+    @staticmethod
+    def _extract_parallel(zip_path: Path, pdf_infos: List[zipfile.ZipInfo]) -> List[Optional[Tuple[str, bytes]]]:
+        """
+        Extract entries on a thread pool (zlib libera o GIL durante a descompressão).
+        ZipFile não é seguro para leituras concorrentes: cada thread abre o seu.
+        """
+        local = threading.local()
+        handles = []
+        
+        def extract(file_info: zipfile.ZipInfo) -> Optional[Tuple[str, bytes]]:
+            zip_ref = getattr(local, 'zip_ref', None)
+            if zip_ref is None:
+                zip_ref = local.zip_ref = zipfile.ZipFile(zip_path, 'r')
+                handles.append(zip_ref)
+            return ZIPExtractor._extract_entry(zip_ref, file_info)
+        
+        try:
+            with ThreadPoolExecutor(max_workers=min(_ZIP_READ_WORKERS, len(pdf_infos))) as executor:
+                return list(executor.map(extract, pdf_infos))
+        finally:
+            for zip_ref in handles:
+                zip_ref.close()
+    
     @staticmethod
     def extract_pdfs_from_bytes(zip_bytes: bytes, source_name: str = "archive") -> List[Tuple[str, bytes]]:
         """
@@ -126,9 +192,9 @@ class ZIPExtractor:
                     
                     if filename.lower().endswith('.pdf'):
                         try:
-                            pdf_bytes = zip_ref.read(filename)
+                            pdf_bytes = ZIPExtractor._read_pdf(zip_ref, file_info)
                             
-                            if FileValidator.is_pdf_from_bytes(pdf_bytes):
+                            if pdf_bytes is not None:
                                 clean_filename = Path(filename).name
                                 pdfs.append((clean_filename, pdf_bytes))
                         except Exception as e:
@@ -146,11 +212,12 @@ class FileHandler:
     """High-level file handling operations"""
     
     @staticmethod
-    def prepare_files_for_processing(file_paths: List[Path]) -> List[Tuple[str, bytes]]:
+    def prepare_files_for_processing(file_paths: List[Path]) -> List[Tuple[str, bytes, str]]:
         """
         Prepare files for processing.
         Handles both direct PDFs and ZIPs containing PDFs.
-        Returns list of (filename, pdf_bytes) tuples.
+        Returns list of (filename, pdf_bytes, source_path) tuples, where source_path
+        is the selected file (the PDF itself or the ZIP it came from).
         """
         files_to_process = []
         
@@ -165,14 +232,16 @@ class FileHandler:
                 try:
                     with open(file_path, 'rb') as f:
                         pdf_bytes = f.read()
-                    files_to_process.append((file_path.name, pdf_bytes))
+                    files_to_process.append((file_path.name, pdf_bytes, str(file_path)))
                     logger.debug(f"Added PDF: {file_path.name}")
                 except Exception as e:
                     logger.error(f"Error reading PDF {file_path}: {e}")
             
             elif file_type == "ZIP":
-                pdfs = ZIPExtractor.extract_pdfs(file_path)
-                files_to_process.extend(pdfs)
+                source = str(file_path)
+                files_to_process.extend(
+                    (filename, pdf_bytes, source) for filename, pdf_bytes in ZIPExtractor.extract_pdfs(file_path)
+                )
         
         logger.info(f"Prepared {len(files_to_process)} files for processing")
         return files_to_process
@@ -8,6 +8,7 @@ sys.path.insert(0, str(Path(__file__).parent / "src"))
 
 from models import Settings, CNPJMapper
 from core import HybridExtractor
+from tests._common import load_pdf_bytes
 
 
 def test_single_file(pdf_path: Path):
@@ -37,8 +38,7 @@ def test_single_file(pdf_path: Path):
     print(f"Testando: {pdf_path.name}")
     print(f"{'='*70}\n")
     
-    with open(pdf_path, "rb") as f:
-        pdf_bytes = f.read()
+    pdf_bytes = load_pdf_bytes(str(pdf_path))
     
     doc, time_taken = extractor.extract(pdf_bytes, pdf_path.name)
     
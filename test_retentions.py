@@ -12,6 +12,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
 from core.extractor_text import TextExtractor
+from tests._common import load_pdf_bytes
 from loguru import logger
 
 # Configure logger para mostrar DEBUG
@@ -32,8 +33,7 @@ def test_single_file(pdf_path: str):
     print("="*80)
     
     # Read PDF
-    with open(pdf_path, 'rb') as f:
-        pdf_bytes = f.read()
+    pdf_bytes = load_pdf_bytes(str(pdf_path))
     
     # Extract
     extractor = TextExtractor()
@@ -87,8 +87,7 @@ def test_batch(folder_path: str, file_list: list):
         
         print(f"\n📄 {filename}")
         
-        with open(pdf_path, 'rb') as f:
-            pdf_bytes = f.read()
+        pdf_bytes = load_pdf_bytes(str(pdf_path))
         
         extractor = TextExtractor()
         doc = extractor.extract(pdf_bytes, filename)
@@ -0,0 +1,11 @@
+"""
+Shared helpers for the manual extraction scripts (test_extraction.py, test_retentions.py).
+"""
+from functools import lru_cache
+from pathlib import Path
+
+
+@lru_cache(maxsize=64)
+def load_pdf_bytes(pdf_path: str) -> bytes:
+    """Read a PDF once per session; repeated runs on the same file hit memory"""
+    return Path(pdf_path).read_bytes()
@@ -0,0 +1,72 @@
+"""
+Unit tests for the on-disk LLM response cache.
+"""
+import unittest
+from pathlib import Path
+import os
+import sys
+import tempfile
+import time
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core import llm_cache
+
+
+class TestLLMCache(unittest.TestCase):
+    """Test cache keys, TTL expiry and corrupt entries"""
+    
+    def setUp(self):
+        """Point the cache at a temporary directory"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self._orig_dir = llm_cache.CACHE_DIR
+        llm_cache.CACHE_DIR = Path(self.tmp.name) / "llm_cache"
+        self.key = llm_cache.make_key("llava:7b", "v1", b"%PDF-1.4 test")
+    
+    def tearDown(self):
+        llm_cache.CACHE_DIR = self._orig_dir
+        self.tmp.cleanup()
+    
+    def test_put_get_roundtrip(self):
+        """A stored result is returned for the same key"""
+        llm_cache.put(self.key, {"numero": "123"})
+        self.assertEqual(llm_cache.get(self.key), {"numero": "123"})
+    
+    def test_key_changes_with_model_prompt_and_content(self):
+        """Model, prompt version and content all invalidate the key"""
+        self.assertEqual(self.key, llm_cache.make_key("llava:7b", "v1", b"%PDF-1.4 test"))
+        self.assertNotEqual(self.key, llm_cache.make_key("llava:7b", "v2", b"%PDF-1.4 test"))
+        self.assertNotEqual(self.key, llm_cache.make_key("moondream", "v1", b"%PDF-1.4 test"))
+        self.assertNotEqual(self.key, llm_cache.make_key("llava:7b", "v1", b"%PDF-1.4 other"))
+        
+        llm_cache.put(self.key, {"numero": "123"})
+        self.assertIsNone(llm_cache.get(llm_cache.make_key("llava:7b", "v2", b"%PDF-1.4 test")))
+    
+    def test_expired_entry_is_ignored(self):
+        """Entries older than TTL_SECONDS are treated as missing"""
+        llm_cache.put(self.key, {"numero": "123"})
+        path = llm_cache.CACHE_DIR / f"{self.key}.json"
+        old = time.time() - llm_cache.TTL_SECONDS - 60
+        os.utime(path, (old, old))
+        self.assertIsNone(llm_cache.get(self.key))
+    
+    def test_corrupt_or_invalid_entry_is_ignored(self):
+        """Unparseable files and non-object JSON return None"""
+        llm_cache.CACHE_DIR.mkdir(parents=True)
+        path = llm_cache.CACHE_DIR / f"{self.key}.json"
+        
+        path.write_bytes(b'{"numero": "12')
+        self.assertIsNone(llm_cache.get(self.key))
+        
+        path.write_bytes(b'["not", "an", "object"]')
+        self.assertIsNone(llm_cache.get(self.key))
+    
+    def test_empty_result_is_not_stored(self):
+        """Empty responses are not cached"""
+        llm_cache.put(self.key, {})
+        self.assertFalse((llm_cache.CACHE_DIR / f"{self.key}.json").exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
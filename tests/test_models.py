@@ -8,7 +8,7 @@ import sys
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
-from models import FiscalDocument, Entity, Address, DocumentType, ProcessingStatus
+from models import FiscalDocument, Entity, Address, DocumentType, ProcessingStatus, SourceStatusTracker
 from models.config import CNPJMapper, FilialMapping
 
 
@@ -88,5 +88,55 @@ class TestCNPJMapper(unittest.TestCase):
         self.assertEqual(result1, result2)
 
 
+
+class TestAIResultNormalization(unittest.TestCase):
+    """FiscalDocument/Entity do not validate on assignment: AI mappers must normalize types"""
+    
+    def test_llm_numero_serie_are_strings(self):
+        """Numeric numero/serie from the LLM JSON are stored as str"""
+        from core.extractor_llm import LLMExtractor
+        doc = FiscalDocument(filename="test.pdf")
+        LLMExtractor.__new__(LLMExtractor)._map_json_to_doc({"numero": 123, "serie": 1}, doc)
+        self.assertEqual(doc.numero, "123")
+        self.assertEqual(doc.serie, "1")
+    
+    def test_text_ai_numero_is_string(self):
+        """numeroDocumento from the text AI fallback is stored as str"""
+        from core.extractor_text import TextExtractor
+        extractor = TextExtractor()
+        doc = extractor._map_ai_result_to_document({"numeroDocumento": 123}, "test.pdf")
+        self.assertEqual(doc.numero, "123")
+        
+        doc = FiscalDocument(filename="test.pdf")
+        extractor._fill_missing_from_ai(doc, {
+            "numeroDocumento": 456,
+            "emitente": {"nomeRazaoSocial": "Empresa", "cnpjCpf": "12.345.678/0001-90"},
+        })
+        self.assertEqual(doc.numero, "456")
+        self.assertEqual(doc.emitente.cnpj, "12345678000190")
+
+
+
+class TestSourceStatusTracker(unittest.TestCase):
+    """Combined status of the PDFs that share one selected file (ZIP)"""
+    
+    def test_processing_beats_terminal(self):
+        tracker = SourceStatusTracker()
+        tracker.update("a.zip", "1.pdf", ProcessingStatus.PROCESSING)
+        status, _ = tracker.update("a.zip", "2.pdf", ProcessingStatus.COMPLETED)
+        self.assertEqual(status, ProcessingStatus.PROCESSING)
+        status, _ = tracker.update("a.zip", "1.pdf", ProcessingStatus.COMPLETED)
+        self.assertEqual(status, ProcessingStatus.COMPLETED)
+    
+    def test_error_beats_completed(self):
+        tracker = SourceStatusTracker()
+        tracker.update("a.zip", "1.pdf", ProcessingStatus.ERROR, "falhou")
+        status, message = tracker.update("a.zip", "2.pdf", ProcessingStatus.COMPLETED)
+        self.assertEqual((status, message), (ProcessingStatus.ERROR, "falhou"))
+        # Outras origens não são afetadas
+        status, _ = tracker.update("b.pdf", "b.pdf", ProcessingStatus.COMPLETED)
+        self.assertEqual(status, ProcessingStatus.COMPLETED)
+
+
 if __name__ == '__main__':
     unittest.main()
